@@ -0,0 +1,104 @@
+from typing import List, Dict, Any, Iterable, Optional
+import os, glob, json, hashlib, time
+
+from .shard import ALL_LABELS
+
+# Options that change the produced PDF; a finished file is redone when any differs.
+OUTPUT_AFFECTING_OPTS = (
+    "mode", "lang", "translate", "dpi", "optimize", "erase", "redact_color",
+    "font_en_name", "font_en_path", "font_hi_name", "font_hi_path", "skip_ocr", "save_profile",
+    "overlay_json", "auto_overlay", "overlay_render", "overlay_align", "overlay_line_spacing",
+    "overlay_margin_px", "overlay_target_dpi", "overlay_scale_x", "overlay_scale_y",
+    "overlay_off_x", "overlay_off_y", "glossary_digest", "block_context",
+)
+
+# ------------------ inputs ------------------
+def collect_inputs(sources: Iterable[str], recursive: bool = False) -> List[str]:
+    """Directories (their *.pdf), glob patterns and plain files -> sorted unique absolute paths."""
+    found = set()
+    for src in sources:
+        if os.path.isdir(src):
+            pattern = os.path.join(src, "**", "*.pdf") if recursive else os.path.join(src, "*.pdf")
+            matches = glob.glob(pattern, recursive=recursive)
+            matches += glob.glob(pattern[:-3] + "PDF", recursive=recursive)
+        else:
+            matches = glob.glob(src, recursive=True) or ([src] if os.path.isfile(src) else [])
+        found.update(os.path.abspath(m) for m in matches if os.path.isfile(m))
+    return sorted(found)
+
+def file_sha256(path: str, chunk: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(chunk)
+            if not buf: break
+            h.update(buf)
+    return h.hexdigest()
+
+def settings_fingerprint(opts: Dict[str, Any]) -> str:
+    picked = {k: opts.get(k) for k in OUTPUT_AFFECTING_OPTS}
+    return hashlib.sha256(json.dumps(picked, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+def plan_output_paths(inputs: List[str], out_dir: str) -> Dict[str, str]:
+    """input -> '<out_dir>/<stem>.pdf'; stems seen twice get a short path hash to stay unique."""
+    stems: Dict[str, int] = {}
+    for p in inputs:
+        stem = os.path.splitext(os.path.basename(p))[0]
+        stems[stem] = stems.get(stem, 0) + 1
+    out = {}
+    for p in inputs:
+        stem = os.path.splitext(os.path.basename(p))[0]
+        if stems[stem] > 1:
+            stem = f"{stem}.{hashlib.sha1(p.encode('utf-8')).hexdigest()[:8]}"
+        out[p] = os.path.join(out_dir, f"{stem}.pdf")
+    return out
+
+def expected_outputs(output_pdf: str, mode: str) -> List[str]:
+    """Every file run_mode may write for output_pdf (mode 'all': one PDF per method + the zip)."""
+    if mode != "all":
+        return [output_pdf]
+    base, ext = os.path.splitext(output_pdf)
+    return [f"{base}.{label}{ext}" for label in ALL_LABELS] + [f"{base}_all_methods.zip"]
+
+def produced_outputs(output_pdf: str, mode: str) -> List[str]:
+    """The expected outputs that exist, by exact name: 'report.*' must not pick up 'report.v2.pdf'."""
+    return [p for p in expected_outputs(output_pdf, mode) if os.path.exists(p)]
+
+# ------------------ JSONL manifest ------------------
+def load_batch_manifest(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Last record per (input hash, settings, output path) key. Lines are appended
+    as files finish, so a run killed mid-way leaves at most one truncated
+    trailing line.
+    """
+    records: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            records[record_key(rec["sha256"], rec.get("settings", ""), rec.get("output", ""))] = rec
+    return records
+
+def record_key(sha256: str, settings: str, output_pdf: str) -> str:
+    """Same content at two input paths has two outputs: each is done on its own."""
+    return f"{sha256}:{settings}:{os.path.abspath(output_pdf)}"
+
+def is_completed(rec: Optional[Dict[str, Any]]) -> bool:
+    """A done record whose outputs are all among the expected names for its output and still exist."""
+    if not rec or rec.get("status") != "done": return False
+    outs = rec.get("outputs", [])
+    expected = set(expected_outputs(rec.get("output", ""), rec.get("mode", "")))
+    return bool(outs) and all(p in expected and os.path.exists(p) for p in outs)
+
+def append_record(path: str, rec: Dict[str, Any]) -> None:
+    rec.setdefault("finished", time.strftime("%Y-%m-%dT%H:%M:%S"))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        f.flush(); os.fsync(f.fileno())
@@ -0,0 +1,148 @@
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+import os, json, shutil, hashlib, tempfile, time, uuid
+
+CACHE_ROOT = os.environ.get("PDF_TRANSLATE_CACHE_DIR",
+                            os.path.join(tempfile.gettempdir(), "pdf_translate_cache"))
+CACHE_MAX_MB = float(os.environ.get("PDF_TRANSLATE_CACHE_MB", "2048"))  # 0 disables the cache
+
+def options_fingerprint(opts: Optional[Dict[str, Any]], exclude: Iterable[str] = ()) -> str:
+    picked = {k: v for k, v in (opts or {}).items() if k not in set(exclude)}
+    return hashlib.sha256(json.dumps(picked, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:24]
+
+def _link_or_copy(src: str, dst: str) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+class ResultCache:
+    """
+    Disk cache of translated outputs with a size cap and LRU eviction.
+
+      <root>/<entry>/meta.json          translated PDF names + base zip name
+      <root>/<entry>/<result>.pdf       pipeline outputs (before annotation)
+      <root>/<entry>/zips/<akey>.zip    packaged result for one annotation setting
+
+    An entry is keyed by (input hash, pipeline options); annotation settings
+    only select the zip, so changing them re-runs annotation alone. Entries are
+    published with an atomic rename, and a hit bumps meta.json's mtime (LRU clock).
+    Safe to share between the worker processes of one machine.
+    """
+    def __init__(self, root: str = CACHE_ROOT, max_mb: float = CACHE_MAX_MB):
+        self.root = root
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        if self.enabled:
+            os.makedirs(self.root, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.root, hashlib.sha256(key.encode("utf-8")).hexdigest()[:32])
+
+    def _meta(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled: return None
+        path = os.path.join(self._entry(key), "meta.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            os.utime(path)
+            return meta
+        except (OSError, ValueError):
+            return None
+
+    # ---- lookups ----
+    def get_zip(self, key: str, akey: str) -> Optional[Tuple[str, str]]:
+        """(zip path, zip name) when this exact result was packaged before."""
+        if self._meta(key) is None: return None
+        zdir = os.path.join(self._entry(key), "zips")
+        zpath = os.path.join(zdir, f"{akey}.zip")
+        try:
+            with open(os.path.join(zdir, f"{akey}.name"), "r", encoding="utf-8") as f:
+                name = f.read().strip()
+        except OSError:
+            return None
+        return (zpath, name) if os.path.exists(zpath) else None
+
+    def get_pdfs(self, key: str, dest_dir: str) -> Optional[Tuple[List[str], str]]:
+        """Link the cached translated PDFs into dest_dir -> (paths, base zip name)."""
+        meta = self._meta(key)
+        if meta is None: return None
+        entry = self._entry(key); out = []
+        try:
+            for name in meta["pdfs"]:
+                dst = os.path.join(dest_dir, name)
+                _link_or_copy(os.path.join(entry, name), dst)
+                out.append(dst)
+        except OSError:
+            return None  # evicted underneath us
+        return out, meta["zip_name"]
+
+    # ---- stores ----
+    def put_pdfs(self, key: str, pdfs: List[str], zip_name: str) -> None:
+        if not self.enabled: return
+        entry = self._entry(key)
+        if os.path.exists(os.path.join(entry, "meta.json")): return
+        tmp = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(os.path.join(tmp, "zips"))
+        for p in pdfs:
+            _link_or_copy(p, os.path.join(tmp, os.path.basename(p)))
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"pdfs": [os.path.basename(p) for p in pdfs], "zip_name": zip_name,
+                       "created": time.time()}, f)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)  # another worker stored it first
+        self.evict()
+
+    def put_zip(self, key: str, akey: str, zip_path: str, zip_name: str) -> None:
+        if not self.enabled: return
+        zdir = os.path.join(self._entry(key), "zips")
+        if not os.path.isdir(zdir): return
+        tmp = os.path.join(zdir, f".{uuid.uuid4().hex}.tmp")
+        try:
+            _link_or_copy(zip_path, tmp)
+            with open(os.path.join(zdir, f"{akey}.name"), "w", encoding="utf-8") as f:
+                f.write(zip_name)
+            os.replace(tmp, os.path.join(zdir, f"{akey}.zip"))
+        except OSError:
+            if os.path.exists(tmp): os.remove(tmp)
+            return
+        self.evict()
+
+    # ---- size cap ----
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        rows = []
+        for name in os.listdir(self.root):
+            entry = os.path.join(self.root, name)
+            meta = os.path.join(entry, "meta.json")
+            if name.startswith(".") or not os.path.exists(meta):
+                continue
+            size = 0
+            for dirpath, _, files in os.walk(entry):
+                for fn in files:
+                    try:
+                        size += os.path.getsize(os.path.join(dirpath, fn))
+                    except OSError:
+                        pass
+            try:
+                rows.append((os.path.getmtime(meta), size, entry))
+            except OSError:
+                pass
+        return rows
+
+    def evict(self) -> int:
+        """Drop least recently used entries until the cache fits max_bytes; returns bytes freed."""
+        if not self.enabled: return 0
+        rows = sorted(self._entries())
+        total = sum(size for _, size, _ in rows)
+        freed = 0
+        for _, size, entry in rows:
+            if total <= self.max_bytes: break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size; freed += size
+        if freed:
+            print(f"[cache] evicted {freed / 1024 / 1024:.1f} MB (now {total / 1024 / 1024:.1f} MB)")
+        return freed
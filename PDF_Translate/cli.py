@@ -1,19 +1,231 @@
-import argparse, os
+import argparse, os, sys, time, shutil, tempfile, traceback, fitz
+from typing import Dict, Any, List, Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from .constants import DEFAULT_TRANSLATE_DIR, DEFAULT_DPI, DEFAULT_ERASE, DEFAULT_LANG, DEFAULT_OPTIMIZE, FONT_EN_LOGICAL, FONT_EN_PATH, FONT_HI_LOGICAL, FONT_HI_PATH
 from .pipeline import run_mode
 from .ocr import ocr_fix_pdf
-from .overlay import build_overlay_items_from_doc, overlay_load_items
-from .utils import build_base, resolve_font
+from .overlay import build_overlay_items_from_doc, overlay_load_items, overlay_items_for_pages
+from .utils import build_base, resolve_font, same_pdf_file, SAVE_PROFILES
 from .textlayer import extract_original_page_objects
+from .glossary import use_glossary, active_glossary
+from .warm import warm_worker, note_job, summarize_workers
+from .shard import parse_page_spec, write_page_subset, create_or_load_manifest, claim_next_shard, release_shard, mark_shard_done, shard_output_pdf, merge_shards
+from .batch import collect_inputs, file_sha256, settings_fingerprint, plan_output_paths, produced_outputs, load_batch_manifest, record_key, is_completed, append_record
 
-# ------------------ CLI ------------------
-def main():
+def translate_pdf(input_pdf: str, output_pdf: str, args, work_dir: str = "temp",
+                  pages: Optional[List[int]] = None, package: bool = True) -> None:
+    """
+    Run the full single-document pipeline (style index, OCR, base, fonts, overlay, mode).
+    pages: when input_pdf is a page subset, the original 0-based page of each of
+    its pages; --overlay-json items (numbered on the original) are remapped to it.
+    package=False: mode 'all' does not zip its outputs (shards are zipped by merge).
+    """
+    # ---- parse colors ----
+    try:
+        redact_rgb = tuple(float(x) for x in args.redact_color.split(","))
+    except Exception:
+        raise SystemExit("Invalid --redact-color. Expected 'r,g,b' floats in [0,1].")
+
+    # ---- OCR-fix (optional) ----
+    src_fixed = input_pdf if args.skip_ocr else ocr_fix_pdf(
+        input_pdf, lang=args.lang, dpi=args.dpi, optimize=args.optimize, out_dir=work_dir
+    )
+
+    # ---- collect original style (from the pre-OCR input) ----
+    # Not needed when the text layer *is* the input: spans already carry its styles.
+    orig_index = None if same_pdf_file(src_fixed, input_pdf) else extract_original_page_objects(input_pdf)
+
+    # ---- build base docs (copies background) ----
+    src, out = build_base(src_fixed)
+
+    # ---- resolve fonts ----
+    en_name, en_file = resolve_font(args.font_en_name, args.font_en_path)
+    # If Hindi font path is omitted or missing, fallback to Base14 helv
+    if args.font_hi_path:
+        hi_name, hi_file = resolve_font(args.font_hi_name, args.font_hi_path)
+    else:
+        hi_name, hi_file = ("helv", None)
+
+    # ---- overlay items (if needed) ----
+    overlay_items = None
+    if args.mode in ("overlay", "all"):
+        if args.overlay_json and os.path.exists(args.overlay_json):
+            overlay_items = overlay_load_items(args.overlay_json)
+            if pages is not None:
+                overlay_items = overlay_items_for_pages(overlay_items, pages)
+        elif args.auto_overlay:
+            # Build directly from the (possibly OCR-fixed) doc in memory
+            overlay_items = build_overlay_items_from_doc(src, args.translate)
+        elif args.mode == "overlay":
+            raise SystemExit(
+                "overlay mode requires --overlay-json or --auto-overlay to supply overlay items."
+            )
+
+    # ---- run selected mode ----
+    run_mode(
+        mode=args.mode,
+        src=src, out=out,
+        orig_index=orig_index,
+        translate_dir=args.translate,
+        erase_mode=args.erase,
+        redact_color=redact_rgb,
+        font_en_name=en_name, font_en_file=en_file,
+        font_hi_name=hi_name, font_hi_file=hi_file,
+        output_pdf=output_pdf,
+        # overlay knobs
+        overlay_items=overlay_items,
+        overlay_render=args.overlay_render,
+        overlay_align=args.overlay_align,
+        overlay_line_spacing=args.overlay_line_spacing,
+        overlay_margin_px=args.overlay_margin_px,
+        overlay_target_dpi=args.overlay_target_dpi,
+        overlay_scale_x=args.overlay_scale_x, overlay_scale_y=args.overlay_scale_y,
+        overlay_off_x=args.overlay_off_x, overlay_off_y=args.overlay_off_y,
+        workers=args.workers,
+        save_profile=args.save_profile,
+        block_context=args.block_context,
+        package=package,
+    )
+
+def run_shard_worker(args) -> None:
+    """
+    Plan (or join) a sharded run and process shards until none are left.
+    Start the same command in several processes / on several nodes sharing the
+    output directory; each claims shards through lock files next to the manifest.
+    """
+    with fitz.open(args.input) as doc:
+        n_pages = len(doc)
+    pages = parse_page_spec(args.pages, n_pages) if args.pages else list(range(n_pages))
+    manifest_path, manifest = create_or_load_manifest(
+        args.input, args.output, args.mode, pages, args.shard_size
+    )
+    print(f"[shard] manifest: {manifest_path} ({len(manifest['shards'])} shards)")
+
+    done = 0
+    while True:
+        idx = claim_next_shard(manifest, only=args.shard_index)
+        if idx is None:
+            break
+        shard_out = shard_output_pdf(manifest, idx)
+        shard_pages = manifest["shards"][idx]["pages"]
+        # the page subset and OCR files stay in a per-shard work dir, not next to the outputs
+        os.makedirs("temp", exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix=os.path.splitext(os.path.basename(shard_out))[0] + ".", dir="temp")
+        t0 = time.perf_counter()
+        try:
+            sub_pdf = write_page_subset(manifest["input"], shard_pages, os.path.join(work_dir, "shard_src.pdf"))
+            translate_pdf(sub_pdf, shard_out, args, work_dir=work_dir, pages=shard_pages, package=False)
+        except BaseException:
+            release_shard(manifest, idx)
+            raise
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        dt = time.perf_counter() - t0
+        mark_shard_done(manifest, idx, dt)
+        done += 1
+        print(f"[shard {idx}] done in {dt:.2f}s -> {shard_out}")
+
+    print(f"[shard] this worker processed {done} shard(s). "
+          f"Merge with: python -m PDF_Translate.cli merge {manifest_path}")
+
+def merge_main(argv=None):
     ap = argparse.ArgumentParser(
-        description="Unified PDF translator (span/line/block/hybrid/overlay/all) with OCR + style preservation."
+        prog="merge",
+        description="Stitch sharded partial outputs (see --shard-size) into the final PDF(s) and zip."
     )
-    ap.add_argument("--input", "-i", required=True, help="Input PDF path")
-    ap.add_argument("--output", "-o", required=True,
-                    help="Output PDF path (for 'all' this is the base name)")
+    ap.add_argument("manifest", help="Path to the '<output>.shards.json' manifest")
+    ap.add_argument("--output", "-o", help="Final output PDF path (defaults to the manifest's output)")
+    ap.add_argument("--save-profile", choices=list(SAVE_PROFILES), default="fast")
+    args = ap.parse_args(argv)
+    try:
+        merge_shards(args.manifest, args.output, save_profile=args.save_profile)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+def _batch_translate_one(input_pdf: str, output_pdf: str, args, work_dir: str) -> Dict[str, Any]:
+    """Pool worker: one file of a batch; never raises so the batch keeps going."""
+    t0 = time.perf_counter()
+    try:
+        translate_pdf(input_pdf, output_pdf, args, work_dir=work_dir)
+        status, error = "done", None
+    except BaseException as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    return {"status": status, "error": error, "seconds": round(time.perf_counter() - t0, 3), "worker": note_job()}
+
+def batch_main(argv=None):
+    ap = argparse.ArgumentParser(
+        prog="batch",
+        description="Translate every PDF of a directory/glob on a process pool, with a resumable JSONL manifest."
+    )
+    ap.add_argument("sources", nargs="+", help="Directories, glob patterns or PDF files")
+    ap.add_argument("--out-dir", "-o", required=True, help="Directory for the translated PDFs")
+    ap.add_argument("--jobs", "-j", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                    help="Files translated concurrently (process pool size)")
+    ap.add_argument("--recursive", "-r", action="store_true", help="Descend into sub-directories")
+    ap.add_argument("--manifest", help="JSONL manifest (default: <out-dir>/batch_manifest.jsonl)")
+    ap.add_argument("--force", action="store_true", help="Redo files the manifest marks as done")
+    add_pipeline_args(ap)
+    args = ap.parse_args(argv)
+    select_glossary(args)
+
+    inputs = collect_inputs(args.sources, recursive=args.recursive)
+    if not inputs:
+        raise SystemExit("No PDFs matched.")
+    manifest_path = args.manifest or os.path.join(args.out_dir, "batch_manifest.jsonl")
+    records = load_batch_manifest(manifest_path)
+    settings = settings_fingerprint(vars(args))
+    outputs = plan_output_paths(inputs, args.out_dir)
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    todo, skipped = [], 0
+    for p in inputs:
+        sha = file_sha256(p)
+        if not args.force and is_completed(records.get(record_key(sha, settings, outputs[p]))):
+            skipped += 1; continue
+        todo.append((p, sha))
+    print(f"[batch] {len(inputs)} file(s): {skipped} already done, {len(todo)} to translate "
+          f"with {args.jobs} process(es); manifest -> {manifest_path}")
+
+    t0 = time.perf_counter(); failed = 0; workers = []
+    # warm_worker: each process loads imports, fonts and the translator once for all its files
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs), initializer=warm_worker) as pool:
+        futs = {
+            pool.submit(_batch_translate_one, p, outputs[p], args,
+                        os.path.join("temp", "batch", os.path.splitext(os.path.basename(outputs[p]))[0])): (p, sha)
+            for p, sha in todo
+        }
+        for i, fut in enumerate(as_completed(futs), 1):
+            p, sha = futs[fut]
+            res = fut.result(); workers.append(res.pop("worker"))
+            rec = {"input": p, "sha256": sha, "settings": settings, "mode": args.mode,
+                   "output": outputs[p], "outputs": produced_outputs(outputs[p], args.mode), **res}
+            if res["status"] == "done" and not rec["outputs"]:
+                rec.update(status="failed", error="no output written")
+            failed += rec["status"] != "done"
+            append_record(manifest_path, rec)
+            print(f"[batch {i}/{len(todo)}] {rec['status']} in {res['seconds']:.1f}s: {p}")
+    print(f"[batch] finished {len(todo) - failed} ok, {failed} failed, {skipped} skipped "
+          f"in {time.perf_counter() - t0:.1f}s")
+    if workers:
+        w = summarize_workers(workers)
+        print(f"[warm] {w['workers']} worker(s) started in {w['startup_s']:.2f}s total "
+              f"(preload {w['preload_s']:.2f}s), "
+              f"{w['amortized_startup_s']:.3f}s per file over {w['jobs']} file(s)")
+    if failed:
+        raise SystemExit(1)
+
+# ------------------ CLI ------------------
+def select_glossary(args) -> None:
+    """Activate --glossary for this process and its workers; records its digest on args."""
+    try:
+        g = use_glossary(args.glossary) if args.glossary else active_glossary()
+    except ValueError as e:
+        raise SystemExit(str(e))
+    args.glossary_digest = g.digest if g is not None else None
+
+def add_pipeline_args(ap: argparse.ArgumentParser) -> None:
+    """Translation/paint options shared by the single-file and batch commands."""
     ap.add_argument("--mode", "-m",
                     choices=["span", "line", "block", "hybrid", "overlay", "all"],
                     default="all",
@@ -32,6 +244,12 @@ def main():
                     help="Erase original text before writing/overlay")
     ap.add_argument("--redact-color", default="1,1,1",
                     help="Redaction fill RGB floats, e.g., '1,1,1' for white")
+    ap.add_argument("--glossary",
+                    help="TSV/JSON glossary of fixed terms (source -> target form); "
+                         "default: $PDF_TRANSLATE_GLOSSARY")
+    ap.add_argument("--block-context", action="store_true",
+                    help="span/line: translate each block in one request (lines as markers) and "
+                         "map the result back onto the lines/spans")
 
     # Fonts
     ap.add_argument("--font-en-name", default=FONT_EN_LOGICAL)
@@ -43,6 +261,15 @@ def main():
     ap.add_argument("--skip-ocr", action="store_true",
                     help="Use original PDF without ocrmypdf pass")
 
+    # Output
+    ap.add_argument("--save-profile", choices=list(SAVE_PROFILES), default="fast",
+                    help="fast: no compression; compact: subset fonts + garbage/dedupe + deflate; "
+                         "web: compact + linearized (needs qpdf)")
+
+    # Parallelism
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Paint span/line/block/hybrid pages with N worker processes (default: 1)")
+
     # ---------- OVERLAY-SPECIFIC KNOBS ----------
     ap.add_argument("--overlay-json",
                     help="Path to text_data.json (required for mode=overlay unless --auto-overlay)")
@@ -65,64 +292,50 @@ def main():
     ap.add_argument("--overlay-off-x", type=float, default=0.0)
     ap.add_argument("--overlay-off-y", type=float, default=0.0)
 
-    args = ap.parse_args()
-
-    # ---- parse colors ----
-    try:
-        redact_rgb = tuple(float(x) for x in args.redact_color.split(","))
-    except Exception:
-        raise SystemExit("Invalid --redact-color. Expected 'r,g,b' floats in [0,1].")
-
-    # ---- collect original style BEFORE OCR ----
-    orig_index = extract_original_page_objects(args.input)
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "merge":
+        return merge_main(argv[1:])
+    if argv and argv[0] == "batch":
+        return batch_main(argv[1:])
 
-    # ---- OCR-fix (optional) ----
-    src_fixed = args.input if args.skip_ocr else ocr_fix_pdf(
-        args.input, lang=args.lang, dpi=args.dpi, optimize=args.optimize
+    ap = argparse.ArgumentParser(
+        description="Unified PDF translator (span/line/block/hybrid/overlay/all) with OCR + style preservation."
     )
+    ap.add_argument("--input", "-i", required=True, help="Input PDF path")
+    ap.add_argument("--output", "-o", required=True,
+                    help="Output PDF path (for 'all' this is the base name)")
+    add_pipeline_args(ap)
 
-    # ---- build base docs (copies background) ----
-    src, out = build_base(src_fixed)
+    # Page selection / sharding
+    ap.add_argument("--pages",
+                    help="1-based page selection, e.g. '1-3,7,10-' (default: all pages)")
+    ap.add_argument("--shard-size", type=int, default=0,
+                    help="Split the selected pages into shards of N pages; writes per-shard outputs "
+                         "plus '<output>.shards.json'. Run the same command on several workers, "
+                         "then 'merge <manifest>'.")
+    ap.add_argument("--shard-index", type=int, default=None,
+                    help="Process only this shard (0-based) instead of claiming shards until none are left")
 
-    # ---- resolve fonts ----
-    en_name, en_file = resolve_font(args.font_en_name, args.font_en_path)
-    # If Hindi font path is omitted or missing, fallback to Base14 helv
-    if args.font_hi_path:
-        hi_name, hi_file = resolve_font(args.font_hi_name, args.font_hi_path)
-    else:
-        hi_name, hi_file = ("helv", None)
+    args = ap.parse_args(argv)
+    select_glossary(args)
 
-    # ---- overlay items (if needed) ----
-    overlay_items = None
-    if args.mode in ("overlay", "all"):
-        if args.overlay_json and os.path.exists(args.overlay_json):
-            overlay_items = overlay_load_items(args.overlay_json)
-        elif args.auto_overlay:
-            # Build directly from the (possibly OCR-fixed) doc in memory
-            overlay_items = build_overlay_items_from_doc(src, args.translate)
-        elif args.mode == "overlay":
-            raise SystemExit(
-                "overlay mode requires --overlay-json or --auto-overlay to supply overlay items."
-            )
+    if args.shard_size > 0:
+        return run_shard_worker(args)
 
-    # ---- run selected mode ----
-    run_mode(
-        mode=args.mode,
-        src=src, out=out,
-        orig_index=orig_index,
-        translate_dir=args.translate,
-        erase_mode=args.erase,
-        redact_color=redact_rgb,
-        font_en_name=en_name, font_en_file=en_file,
-        font_hi_name=hi_name, font_hi_file=hi_file,
-        output_pdf=args.output,
-        # overlay knobs
-        overlay_items=overlay_items,
-        overlay_render=args.overlay_render,
-        overlay_align=args.overlay_align,
-        overlay_line_spacing=args.overlay_line_spacing,
-        overlay_margin_px=args.overlay_margin_px,
-        overlay_target_dpi=args.overlay_target_dpi,
-        overlay_scale_x=args.overlay_scale_x, overlay_scale_y=args.overlay_scale_y,
-        overlay_off_x=args.overlay_off_x, overlay_off_y=args.overlay_off_y,
-    )
\ No newline at end of file
+    if not args.pages:
+        return translate_pdf(args.input, args.output, args)
+    with fitz.open(args.input) as doc:
+        pages = parse_page_spec(args.pages, len(doc))
+    # per-run work dir: concurrent --pages runs must not overwrite each other's subset/OCR files
+    os.makedirs("temp", exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix="pages.", dir="temp")
+    try:
+        input_pdf = write_page_subset(args.input, pages, os.path.join(work_dir, "pages_selected.pdf"))
+        print(f"[pages] {len(pages)} page(s) selected -> {input_pdf}")
+        translate_pdf(input_pdf, args.output, args, work_dir=work_dir, pages=pages)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
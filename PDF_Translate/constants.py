@@ -1,4 +1,3 @@
-from googletrans import Translator
 from pathlib import Path
 import re
 
@@ -19,6 +18,14 @@ FONT_HI_PATH    = str(Path(__file__).resolve().parent.parent / r"assets/fonts/Ti
 FONT_HI_LOGICAL_2 = "NotoSansDevanagari"
 FONT_HI_PATH_2    = str(Path(__file__).resolve().parent.parent / r"assets/fonts/NotoSansDevanagari-Regular.ttf")
 
-_TR = Translator(timeout=TR_TIMEOUT, service_urls=["translate.googleapis.com"])
+_TR = None  # googletrans client, built by translator() on first use; assign to override
 _DEV = re.compile(r"[\u0900-\u097F]")   # Devanagari
-_LAT = re.compile(r"[A-Za-z]")
\ No newline at end of file
+_LAT = re.compile(r"[A-Za-z]")
+
+def translator():
+    """The shared translator. googletrans (and its HTTP stack) is imported on the first call, not at import."""
+    global _TR
+    if _TR is None:
+        from googletrans import Translator
+        _TR = Translator(timeout=TR_TIMEOUT, service_urls=["translate.googleapis.com"])
+    return _TR
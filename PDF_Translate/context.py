@@ -0,0 +1,92 @@
+from dataclasses import dataclass, field
+from typing import List, Tuple, Sequence, Dict, Optional, Callable
+
+from .utils import choose_langs
+from .repeats import Placement, RepeatMemo
+from .textlayer import translate_text, is_pass_through
+
+# Units (spans or lines) are grouped by the text-layer block they came from;
+# keys[i] = (page, block_no, line_no) as filled in by extract_*_from_textlayer(keys=...).
+UnitKey = Tuple[int, int, int]
+
+@dataclass(slots=True)
+class ContextBlock:
+    page: int
+    rect: Tuple[float, float, float, float]
+    lines: List[List[int]] = field(default_factory=list)   # unit indices per line, in order
+    weights: List[List[int]] = field(default_factory=list) # source text length of those units
+    line_texts: List[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.line_texts)
+
+def build_context_blocks(units: Sequence, keys: Sequence[UnitKey]) -> List[ContextBlock]:
+    """Group units (objects with .page/.rect/.text) into their blocks and lines, keeping order."""
+    blocks: Dict[Tuple[int, int], ContextBlock] = {}
+    line_of: Dict[UnitKey, int] = {}
+    for i, (u, key) in enumerate(zip(units, keys)):
+        bl = blocks.get(key[:2])
+        if bl is None:
+            bl = blocks[key[:2]] = ContextBlock(u.page, tuple(u.rect))
+        else:
+            r = bl.rect
+            bl.rect = (min(r[0], u.rect[0]), min(r[1], u.rect[1]), max(r[2], u.rect[2]), max(r[3], u.rect[3]))
+        li = line_of.get(key)
+        if li is None:
+            li = line_of[key] = len(bl.lines)
+            bl.lines.append([]); bl.weights.append([]); bl.line_texts.append("")
+        bl.lines[li].append(i); bl.weights[li].append(max(1, len(u.text)))
+        bl.line_texts[li] = " ".join(" ".join((bl.line_texts[li], u.text)).split())
+    return list(blocks.values())
+
+def context_placements(blocks: List[ContextBlock]) -> List[Placement]:
+    return [(bl.page, bl.rect, bl.text) for bl in blocks]
+
+def split_by_ratio(text: str, weights: Sequence[float]) -> List[str]:
+    """Cut text at word boundaries into len(weights) parts sized like weights."""
+    if len(weights) <= 1:
+        return [text]
+    words = text.split()
+    total_w = float(sum(weights)) or 1.0
+    total_c = float(sum(len(w) + 1 for w in words)) or 1.0
+    parts: List[List[str]] = [[] for _ in weights]
+    bounds, acc = [], 0.0
+    for w in weights:
+        acc += w; bounds.append(acc / total_w)
+    pos, k = 0.0, 0
+    for w in words:
+        mid = (pos + (len(w) + 1) / 2.0) / total_c  # word goes to the part its middle falls in
+        while k < len(bounds) - 1 and mid > bounds[k]: k += 1
+        parts[k].append(w); pos += len(w) + 1
+    return [" ".join(p) for p in parts]
+
+def translate_in_context(blocks: List[ContextBlock], units: Sequence, translate_dir: str,
+                         repeats: Optional[RepeatMemo] = None,
+                         check_cancel: Optional[Callable[[], None]] = None) -> List[str]:
+    """
+    One request per block, lines joined by '\\n' (the line marker). The result
+    is projected back by marker when the line count survives, else by the
+    source lines' length ratio; a line's text is shared among its spans by
+    length ratio. Lines that would pass through on their own (links, numbers)
+    keep their source text. Returns the translated text of every unit, by unit index.
+    check_cancel, if given, is called before each block's request.
+    """
+    out = [""] * len(units)
+    for bl in blocks:
+        if check_cancel: check_cancel()
+        sl, dl = choose_langs(bl.text, translate_dir)
+        if repeats is not None:
+            res = repeats.translate(bl.text, bl.rect, sl, dl) or ""
+        else:
+            res = translate_text(bl.text, sl, dl) or ""
+        lines = [ln.strip() for ln in res.split("\n")]
+        if len(lines) != len(bl.lines):
+            lines = split_by_ratio(" ".join(res.split()), [len(t) for t in bl.line_texts])
+        for idxs, weights, src, text in zip(bl.lines, bl.weights, bl.line_texts, lines):
+            if is_pass_through(src, dl):
+                for i in idxs: out[i] = units[i].text
+                continue
+            for i, part in zip(idxs, split_by_ratio(text, weights)):
+                out[i] = part
+    return out
@@ -0,0 +1,149 @@
+from typing import Dict, List, Optional, Tuple
+import os, json, hashlib, unicodedata
+
+GLOSSARY_ENV = "PDF_TRANSLATE_GLOSSARY"
+
+def _norm_char(c: str) -> str:
+    if c.isspace(): return " "
+    lc = c.lower()
+    return lc if len(lc) == 1 else c
+
+def _is_word_char(c: str) -> bool:
+    return unicodedata.category(c)[0] in "LMN"  # letters, (Devanagari) marks, digits
+
+class Glossary:
+    """
+    Fixed source term -> target form pairs, compiled into one Aho-Corasick
+    automaton. find() reports leftmost-longest, whole-word, non-overlapping
+    matches in time linear in the text (plus the number of matches), whatever
+    the glossary size. Matching ignores case and collapses runs of whitespace.
+    """
+    def __init__(self, pairs: List[Tuple[str, str]], digest: str = ""):
+        self.targets: List[str] = []
+        self.lengths: List[int] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._term: List[int] = [-1]  # term index ending at this node, -1 if none
+        for source, target in pairs:
+            key = "".join(_norm_char(c) for c in " ".join(source.split()))
+            if not key or not target: continue
+            node = 0
+            for c in key:
+                nxt = self._goto[node].get(c)
+                if nxt is None:
+                    nxt = self._goto[node][c] = len(self._goto)
+                    self._goto.append({}); self._term.append(-1)
+                node = nxt
+            if self._term[node] < 0:
+                self._term[node] = len(self.targets)
+                self.targets.append(target); self.lengths.append(len(key))
+            else:
+                self.targets[self._term[node]] = target  # later entries win
+        self._build_links()
+        self.digest = digest or hashlib.sha256(json.dumps(pairs, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    def _build_links(self) -> None:
+        n = len(self._goto)
+        self._fail = [0] * n
+        self._out = [0] * n  # nearest node on the fail chain that ends a term (0: none)
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for c, nxt in self._goto[node].items():
+                f = self._fail[node]
+                while f and c not in self._goto[f]: f = self._fail[f]
+                cand = self._goto[f].get(c, 0)
+                self._fail[nxt] = cand if cand != nxt else 0
+                self._out[nxt] = self._fail[nxt] if self._term[self._fail[nxt]] >= 0 else self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """[(start, end, target form)] into text, sorted and non-overlapping."""
+        if not self.targets or not text: return []
+        # collapse whitespace runs, remembering where each kept char came from
+        chars: List[str] = []; where: List[int] = []
+        for i, c in enumerate(text):
+            c = _norm_char(c)
+            if c == " " and chars and chars[-1] == " ": continue
+            chars.append(c); where.append(i)
+
+        best: Dict[int, Tuple[int, int]] = {}  # start -> (end, term), longest per start
+        goto, fail, term, out = self._goto, self._fail, self._term, self._out
+        node = 0
+        for j, c in enumerate(chars):
+            while node and c not in goto[node]: node = fail[node]
+            node = goto[node].get(c, 0)
+            hit = node if term[node] >= 0 else out[node]
+            while hit:
+                t = term[hit]; start = j + 1 - self.lengths[t]
+                a, b = where[start], where[j] + 1
+                if (a == 0 or not _is_word_char(text[a - 1])) and (b == len(text) or not _is_word_char(text[b])):
+                    if start not in best or best[start][0] < b: best[start] = (b, t)
+                hit = out[hit]
+
+        spans: List[Tuple[int, int, str]] = []; last = 0
+        for start in sorted(best):
+            b, t = best[start]; a = where[start]
+            if a >= last:
+                spans.append((a, b, self.targets[t])); last = b
+        return spans
+
+# ------------------ loading ------------------
+def load_glossary(path: str) -> Glossary:
+    """
+    TSV: 'source<TAB>target' per line ('#' comments and blank lines skipped).
+    JSON: {"source": "target", ...}, [["source", "target"], ...] or
+    [{"source": ..., "target": ...}, ...].
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    text = raw.decode("utf-8-sig")
+    pairs: List[Tuple[str, str]] = []
+    if path.lower().endswith(".json"):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            pairs = [(str(k), str(v)) for k, v in data.items()]
+        else:
+            for row in data:
+                if isinstance(row, dict): pairs.append((str(row["source"]), str(row["target"])))
+                else: pairs.append((str(row[0]), str(row[1])))
+    else:
+        for line in text.splitlines():
+            if not line.strip() or line.lstrip().startswith("#"): continue
+            cols = line.split("\t")
+            if len(cols) >= 2: pairs.append((cols[0].strip(), cols[1].strip()))
+    return Glossary(pairs, digest=hashlib.sha256(raw).hexdigest()[:16])
+
+_LOADED: Dict[str, Tuple[Tuple[float, int], Glossary]] = {}
+_MISSING: set = set()
+
+def active_glossary() -> Optional[Glossary]:
+    """
+    Glossary named by $PDF_TRANSLATE_GLOSSARY (None when unset). Compiled once
+    per process and path, and again only when the file changes.
+    """
+    path = os.environ.get(GLOSSARY_ENV)
+    if not path: return None
+    try:
+        st = os.stat(path); stamp = (st.st_mtime, st.st_size)
+    except OSError:
+        if path not in _MISSING:
+            _MISSING.add(path); print(f"[WARN] glossary not found: {path}")
+        return None
+    hit = _LOADED.get(path)
+    if hit is None or hit[0] != stamp:
+        g = load_glossary(path)
+        print(f"[glossary] {len(g)} terms from {path}")
+        _LOADED[path] = hit = (stamp, g)
+    return hit[1]
+
+def use_glossary(path: Optional[str]) -> Optional[Glossary]:
+    """Select the glossary for this process and the worker processes it starts (None clears it)."""
+    if path:
+        if not os.path.isfile(path):
+            raise ValueError(f"Glossary file not found: {path}")
+        os.environ[GLOSSARY_ENV] = os.path.abspath(path)
+    else:
+        os.environ.pop(GLOSSARY_ENV, None)
+    return active_glossary()
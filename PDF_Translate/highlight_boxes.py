@@ -1,4 +1,9 @@
-import re, fitz
+import re, os, json, time, fitz
+from pathlib import Path
+from typing import Optional, Tuple, List
+from concurrent.futures import ProcessPoolExecutor
+
+from .utils import save_pdf
 
 # ----------------------------
 # Helpers (for annotations)
@@ -13,20 +18,23 @@ def _hex_to_rgb01(hx: str):
 def _expand_rect(x0, y0, x1, y1, margin):
     return (x0 - margin, y0 - margin, x1 + margin, y1 + margin)
 
-def add_boxes_to_pdf(
-    input_pdf: str,
+def draw_boxes(
+    doc: fitz.Document,
     items: list,
-    output_pdf: str,
     page_is_one_based: bool = False,
     color=(1, 0, 0),
     stroke_width: float = 1.5,
     fill_opacity: float = 0.15,
     use_annot: bool = True,
     fill: bool = True,
-):
-    """Add rectangle boxes to a PDF using either annotation layer or drawn shapes."""
-    doc = fitz.open(input_pdf)
-    n_pages = len(doc)
+) -> int:
+    """
+    Add rectangle boxes to an open document in place; returns how many were drawn.
+    Drawn boxes go through one Shape per page (one content-stream commit per
+    page, not per box); each box keeps its own finish, so overlaps look the same.
+    """
+    n_pages = len(doc); drawn = 0
+    shapes = {}
 
     for i, item in enumerate(items):
         try:
@@ -49,23 +57,46 @@ def add_boxes_to_pdf(
                     annot.set_opacity(fill_opacity)
                 annot.update()
             else:
-                page.draw_rect(
-                    rect,
+                sh = shapes.get(p)
+                if sh is None:
+                    sh = shapes[p] = page.new_shape()
+                sh.draw_rect(rect)
+                sh.finish(
                     color=color,
                     width=stroke_width,
                     fill=(color if fill else None),
                     fill_opacity=(fill_opacity if fill else 0.0),
                 )
+            drawn += 1
         except Exception:
             # Skip malformed entries robustly
             continue
 
+    for sh in shapes.values():
+        sh.commit()
+    return drawn
+
+def add_boxes_to_pdf(
+    input_pdf: str,
+    items: list,
+    output_pdf: str,
+    page_is_one_based: bool = False,
+    color=(1, 0, 0),
+    stroke_width: float = 1.5,
+    fill_opacity: float = 0.15,
+    use_annot: bool = True,
+    fill: bool = True,
+):
+    """Add rectangle boxes to a PDF using either annotation layer or drawn shapes."""
+    doc = fitz.open(input_pdf)
+    draw_boxes(doc, items, page_is_one_based=page_is_one_based, color=color,
+               stroke_width=stroke_width, fill_opacity=fill_opacity, use_annot=use_annot, fill=fill)
     doc.save(output_pdf, garbage=4, deflate=True)
     doc.close()
     return output_pdf
 
-def build_annotation_items_from_pdf(
-    pdf_path: str,
+def annotation_items_from_doc(
+    doc: fitz.Document,
     mode: str = "devanagari_words",
     regex_pattern: str = r"[\u0900-\u097F]+",
     min_w: float = 1.0,
@@ -74,7 +105,7 @@ def build_annotation_items_from_pdf(
     margin: float = 0.0,
 ):
     """
-    Create a list of {'page': int, 'bbox': [x0,y0,x1,y1]} items derived from the PDF content.
+    Create a list of {'page': int, 'bbox': [x0,y0,x1,y1]} items derived from the document's text.
     - mode:
         'devanagari_words' -> words containing Devanagari chars ([\u0900-\u097F])
         'english_words'    -> words with A-Za-z
@@ -84,7 +115,6 @@ def build_annotation_items_from_pdf(
     - margin: expand each rectangle by this many points on all sides.
     """
     items = []
-    doc = fitz.open(pdf_path)
 
     # Compile regex if needed
     rx = None
@@ -161,6 +191,60 @@ def build_annotation_items_from_pdf(
                         continue
                     x0, y0, x1, y1 = _expand_rect(x0, y0, x1, y1, margin)
                     items.append({"page": page_ix, "bbox": [x0, y0, x1, y1]})
+    return items
 
-    doc.close()
-    return items
\ No newline at end of file
+def build_annotation_items_from_pdf(pdf_path: str, **kwargs):
+    """annotation_items_from_doc on a PDF file (see there for the options)."""
+    with fitz.open(pdf_path) as doc:
+        return annotation_items_from_doc(doc, **kwargs)
+
+# Keys of an annotation settings dict (app / job options) and where they go.
+# Besides these: 'json' (write the items), 'save_profile' + 'garbage' (annotated
+# PDF save; default compact, garbage 4) and 'workers' (see annotate_pdf_files).
+ANNOT_ITEM_KEYS = ("mode", "regex_pattern", "min_w", "min_h", "merge_lines", "margin")
+ANNOT_DRAW_KEYS = ("color", "stroke_width", "fill_opacity", "use_annot", "fill")
+DEFAULT_ANNOT_WORKERS = int(os.environ.get("PDF_TRANSLATE_ANNOT_WORKERS", str(min(5, os.cpu_count() or 1))))
+
+# (annotated PDF, items JSON or None, seconds)
+AnnotResult = Tuple[str, Optional[str], float]
+
+def annotate_open_doc(doc: fitz.Document, output_pdf: str, settings: dict) -> AnnotResult:
+    """
+    Box the text of an already painted output document and save it once as
+    '<stem>.annot.pdf' next to output_pdf. Call after the clean output was saved:
+    the boxes are drawn into doc itself. settings: ANNOT_ITEM_KEYS + ANNOT_DRAW_KEYS,
+    plus 'json' (default off) to also write '<stem>.annotation_items.json' (compact).
+    """
+    t0 = time.perf_counter()
+    item_kw = {k: settings[k] for k in ANNOT_ITEM_KEYS if k in settings}
+    draw_kw = {k: settings[k] for k in ANNOT_DRAW_KEYS if k in settings}
+    item_kw.setdefault("merge_lines", False); draw_kw.setdefault("use_annot", False)
+    items = annotation_items_from_doc(doc, **item_kw)
+    draw_boxes(doc, items, **draw_kw)
+
+    p = Path(output_pdf)
+    out_annot = p.with_name(p.stem + ".annot.pdf")
+    save_pdf(doc, str(out_annot), settings.get("save_profile", "compact"), settings.get("garbage"))
+    json_path = None
+    if settings.get("json"):
+        json_path = p.with_name(p.stem + ".annotation_items.json")
+        with open(json_path, "w", encoding="utf-8") as jf:
+            json.dump(items, jf, ensure_ascii=False, separators=(",", ":"))
+    return str(out_annot), (str(json_path) if json_path else None), time.perf_counter() - t0
+
+def _annotate_file(job: Tuple[str, dict]) -> AnnotResult:
+    path, settings = job
+    with fitz.open(path) as doc:
+        return annotate_open_doc(doc, path, settings)
+
+def annotate_pdf_files(pdfs: list, workers: Optional[int] = None, **settings) -> List[AnnotResult]:
+    """
+    Annotate already saved PDFs (e.g. the outputs of "all" mode or ones reused
+    from the result cache), one output per pool worker; results keep the input order.
+    """
+    workers = DEFAULT_ANNOT_WORKERS if workers is None else workers
+    jobs = [(str(p), settings) for p in pdfs]
+    if workers <= 1 or len(jobs) <= 1:
+        return [_annotate_file(j) for j in jobs]
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as ex:
+        return list(ex.map(_annotate_file, jobs))
@@ -1,20 +1,24 @@
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import Callable, List, Tuple
+from bisect import bisect_left
+from itertools import accumulate
 import fitz
 
-@dataclass
+from .textlayer import PageText
+
+@dataclass(slots=True)
 class HybridSegment:
     rect: Tuple[float, float, float, float]
     text: str
     sizes: List[float]
 
-@dataclass
+@dataclass(slots=True)
 class HybridLine:
     rect: Tuple[float, float, float, float]
     text: str
     segments: List[HybridSegment]
 
-@dataclass
+@dataclass(slots=True)
 class HybridBlock:
     page: int
     rect: Tuple[float, float, float, float]
@@ -29,15 +33,10 @@ def extract_blocks_with_segments(doc: fitz.Document) -> List[HybridBlock]:
     segments by large x-gaps so we can place translated text per cell.
     """
     blocks: List[HybridBlock] = []
-    try:
-        PRES = fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_PRESERVE_LIGATURES
-        getter = lambda p: p.get_textpage(flags=PRES).extractRAWDICT()
-    except Exception:
-        getter = lambda p: p.get_text("rawdict")
 
     for pno in range(len(doc)):
-        raw = getter(doc[pno])
-        for b in raw.get("blocks", []):
+        pt = PageText(doc[pno])
+        for bi, b in enumerate(pt.blocks()):
             if "lines" not in b: 
                 continue
             brect = tuple(map(float, b.get("bbox", (0, 0, 0, 0))))
@@ -47,28 +46,15 @@ def extract_blocks_with_segments(doc: fitz.Document) -> List[HybridBlock]:
             bw = max(1.0, brect[2] - brect[0])
             SEG_GAP = max(10.0, 0.12 * bw)  # 12% of block width or 10 px
 
-            for ln in b.get("lines", []):
+            for li, ln in enumerate(b.get("lines", [])):
                 spans = ln.get("spans", [])
                 if not spans:
                     continue
                 pieces = []  # (bbox, text, size)
                 rects  = []
                 sizes  = []
-                for sp in spans:
-                    if isinstance(sp.get("text"), str) and sp["text"].strip():
-                        t = " ".join(sp["text"].split())
-                        bb = tuple(map(float, sp.get("bbox", brect)))
-                    else:
-                        chars = sp.get("chars") or []
-                        t = "".join(ch.get("c", "") for ch in chars).strip()
-                        if chars:
-                            xs0 = [c["bbox"][0] for c in chars if "bbox" in c]
-                            ys0 = [c["bbox"][1] for c in chars if "bbox" in c]
-                            xs1 = [c["bbox"][2] for c in chars if "bbox" in c]
-                            ys1 = [c["bbox"][3] for c in chars if "bbox" in c]
-                            bb = (min(xs0), min(ys0), max(xs1), max(ys1)) if xs0 else tuple(map(float, brect))
-                        else:
-                            bb = tuple(map(float, brect))
+                for si, sp in enumerate(spans):
+                    t, bb = pt.span_text_bbox(sp, (bi, li, si), brect)
                     if t:
                         pieces.append((bb, t, float(sp.get("size", 11.5))))
                     rects.append(bb)
@@ -151,4 +137,26 @@ def build_columns(hb: HybridBlock) -> List[Tuple[float, float]]:
             cols.append([x0, x1])
         else:
             cols[-1][1] = max(cols[-1][1], x1)
-    return [(c[0], c[1]) for c in cols]
\ No newline at end of file
+    return [(c[0], c[1]) for c in cols]
+
+
+def column_lookup(cols: List[Tuple[float, float]]) -> Callable[[Tuple[float, ...]], Tuple[float, float]]:
+    """
+    rect -> the column (from build_columns, sorted by x0) it overlaps most;
+    the leftmost on ties and cols[0] when it overlaps none. Bisects on the
+    column starts and walks left only while a column can still reach rect.
+    """
+    starts = [c[0] for c in cols]
+    reach = list(accumulate((c[1] for c in cols), max))  # furthest x1 among cols[:i+1]
+
+    def best(rect: Tuple[float, ...]) -> Tuple[float, float]:
+        x0, x1 = rect[0], rect[2]
+        hit, best_ov = 0, 0.0
+        for i in range(bisect_left(starts, x1) - 1, -1, -1):
+            if reach[i] <= x0:
+                break
+            ov = min(x1, cols[i][1]) - max(x0, cols[i][0])
+            if ov >= best_ov and ov > 0.0:
+                hit, best_ov = i, ov
+        return cols[hit]
+    return best
@@ -0,0 +1,361 @@
+from typing import Dict, Any, Optional, List, Tuple
+from concurrent.futures import ProcessPoolExecutor, Future
+from functools import partial
+from pathlib import Path
+import multiprocessing as mp
+import os, json, time, uuid, shutil, hashlib, tempfile, threading
+
+from .ocr import ocr_fix_pdf
+from .textlayer import extract_original_page_objects
+from .utils import build_base, resolve_font, same_pdf_file, PdfSource, write_zip
+from .overlay import build_overlay_items_from_doc
+from .pipeline import run_mode
+from .highlight_boxes import annotate_pdf_files
+from .cache import ResultCache, options_fingerprint
+from .glossary import active_glossary
+from .warm import warm_worker, warm_ping, note_job, summarize_workers
+from .constants import (FONT_EN_LOGICAL, FONT_EN_PATH, FONT_HI_LOGICAL_2, FONT_HI_PATH_2,
+                        DEFAULT_LANG, DEFAULT_DPI, DEFAULT_OPTIMIZE, DEFAULT_TRANSLATE_DIR, DEFAULT_ERASE)
+
+JOB_ROOT = os.path.join(tempfile.gettempdir(), "pdf_translate_jobs")
+DEFAULT_JOB_WORKERS = int(os.environ.get("PDF_TRANSLATE_JOB_WORKERS", "2"))
+JOB_MAX_AGE_S = float(os.environ.get("PDF_TRANSLATE_JOB_MAX_AGE_S", str(6 * 3600)))
+# Annotation processes each job worker may start on its own (1: annotate inline).
+# The pool then runs at most max_workers * max(1, annot_workers) translation processes.
+JOB_ANNOT_WORKERS = int(os.environ.get("PDF_TRANSLATE_JOB_ANNOT_WORKERS", "1"))
+
+# Options a job falls back to when the caller leaves them out (HTTP API, batch).
+JOB_DEFAULTS: Dict[str, Any] = {
+    "mode": "block", "translate_dir": DEFAULT_TRANSLATE_DIR, "erase_mode": DEFAULT_ERASE,
+    "lang": DEFAULT_LANG, "dpi": DEFAULT_DPI, "optimize": DEFAULT_OPTIMIZE, "skip_ocr": False,
+    "auto_overlay": True, "overlay_render": "image", "overlay_align": 0,
+    "overlay_line_spacing": 1.10, "overlay_margin_px": 0.1, "overlay_target_dpi": 600,
+    "overlay_scale_x": 1.0, "overlay_scale_y": 1.0, "overlay_off_x": 0.0, "overlay_off_y": 0.0,
+    "font_en_path": FONT_EN_PATH, "font_hi_path": FONT_HI_PATH_2,
+    "save_profile": "fast", "annotate": None, "block_context": False,
+}
+
+# Rough share of the total run reached when each stage starts (for progress bars).
+STAGE_PROGRESS = {
+    "queued": 0.0, "ocr": 0.05, "style": 0.30, "overlay": 0.35,
+    "translate": 0.45, "annotate": 0.85, "package": 0.95, "done": 1.0,
+}
+
+class JobCancelled(Exception):
+    pass
+
+# ------------------ status file (shared between parent and worker) ------------------
+def _status_path(job_dir: str) -> str:
+    return os.path.join(job_dir, "status.json")
+
+def read_status(job_dir: str) -> Dict[str, Any]:
+    try:
+        with open(_status_path(job_dir), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_status(job_dir: str, **fields) -> None:
+    st = read_status(job_dir); st.update(fields)
+    tmp = _status_path(job_dir) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(st, f)
+    os.replace(tmp, _status_path(job_dir))
+
+def _check_cancel(job_dir: str) -> None:
+    if os.path.exists(os.path.join(job_dir, "cancel")):
+        raise JobCancelled("cancelled")
+
+# ------------------ worker side ------------------
+def _as_file(source: PdfSource, path: str) -> str:
+    if isinstance(source, str): return source
+    with open(path, "wb") as f:
+        f.write(source)
+    return path
+
+def _annotated_outputs(pdf: Path) -> Optional[Tuple[str, Optional[str], Optional[float]]]:
+    """(annot_pdf, json or None, None) that run_mode wrote next to pdf, if any."""
+    annot_pdf = pdf.with_name(pdf.stem + ".annot.pdf")
+    if not annot_pdf.exists(): return None
+    js = pdf.with_name(pdf.stem + ".annotation_items.json")
+    return str(annot_pdf), (str(js) if js.exists() else None), None
+
+def _translate_to_pdfs(job_dir: str, input_pdf: PdfSource, opts: Dict[str, Any], stage) -> Tuple[List[Path], str]:
+    """
+    OCR-fix + run_mode into job_dir -> (produced PDFs, base zip name). With
+    opts['annotate'] (single modes), run_mode also writes each output's
+    '.annot.pdf' in the same pass.
+    """
+    stage("ocr")
+    src_fixed, ocr_input = input_pdf, input_pdf
+    if not opts.get("skip_ocr"):
+        # ocrmypdf is an external program: the only step that needs the upload on disk
+        ocr_input = _as_file(input_pdf, os.path.join(job_dir, "input.pdf"))
+        src_fixed = ocr_fix_pdf(ocr_input, lang=opts["lang"], dpi=opts["dpi"],
+                                optimize=opts["optimize"], out_dir=job_dir)
+
+    stage("style")
+    orig_index = None if same_pdf_file(src_fixed, ocr_input) else extract_original_page_objects(input_pdf)
+    src, out = build_base(src_fixed)
+
+    en_name, en_file = resolve_font(FONT_EN_LOGICAL, opts["font_en_path"])
+    if opts.get("font_hi_path"):
+        hi_name, hi_file = resolve_font(FONT_HI_LOGICAL_2, opts["font_hi_path"])
+    else:
+        hi_name, hi_file = ("helv", None)
+
+    mode = opts["mode"]
+    overlay_items = None
+    if mode in ("overlay", "all"):
+        if opts.get("auto_overlay"):
+            stage("overlay")
+            overlay_items = build_overlay_items_from_doc(src, opts["translate_dir"],
+                                                         check_cancel=partial(_check_cancel, job_dir))
+        elif mode == "overlay":
+            raise ValueError("Overlay mode requires JSON or enable Auto overlay.")
+
+    stage("translate")
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    out_name = f"result_{timestamp}.pdf" if mode != "all" else f"result_{timestamp}.all.pdf"
+    workdir = Path(job_dir)
+    output_pdf_path = str(workdir / out_name)
+    run_mode(
+        mode=mode,
+        src=src, out=out,
+        orig_index=orig_index,
+        translate_dir=opts["translate_dir"],
+        erase_mode=opts["erase_mode"],
+        redact_color=(1, 1, 1),
+        font_en_name=en_name, font_en_file=en_file,
+        font_hi_name=hi_name, font_hi_file=hi_file,
+        output_pdf=output_pdf_path,
+        overlay_items=overlay_items,
+        overlay_render=opts["overlay_render"],
+        overlay_align=int(opts["overlay_align"]),
+        overlay_line_spacing=float(opts["overlay_line_spacing"]),
+        overlay_margin_px=float(opts["overlay_margin_px"]),
+        overlay_target_dpi=int(opts["overlay_target_dpi"]),
+        overlay_scale_x=float(opts["overlay_scale_x"]),
+        overlay_scale_y=float(opts["overlay_scale_y"]),
+        overlay_off_x=float(opts["overlay_off_x"]),
+        overlay_off_y=float(opts["overlay_off_y"]),
+        save_profile=opts.get("save_profile", "fast"),
+        block_context=bool(opts.get("block_context", False)),
+        # "all" annotates its outputs afterwards on a pool (see run_translation_job)
+        annotate=opts.get("annotate") if mode != "all" else None,
+        check_cancel=partial(_check_cancel, job_dir),
+        package=False,  # the package stage zips the outputs (with annotations, if any)
+    )
+
+    # Collect produced PDFs (not the '.annot.pdf' copies written alongside)
+    if mode == "all":
+        pdfs = sorted(p for p in workdir.glob(f"result_{timestamp}.all.*.pdf")
+                      if not p.name.endswith(".annot.pdf"))
+        zip_name = f"result_{timestamp}.all_all_methods.zip"
+    else:
+        pdfs = [Path(output_pdf_path)] if Path(output_pdf_path).exists() else sorted(workdir.glob(f"result_{timestamp}*.pdf"))
+        zip_name = f"result_{timestamp}.{mode}.zip"
+    if not pdfs:
+        raise RuntimeError("No PDFs produced by the pipeline.")
+    return pdfs, zip_name
+
+def run_translation_job(job_dir: str, input_pdf: PdfSource, opts: Dict[str, Any],
+                        cache_key: Optional[str] = None,
+                        cache: Optional[ResultCache] = None,
+                        annot_workers: int = JOB_ANNOT_WORKERS) -> Dict[str, Any]:
+    """
+    Worker entry point: OCR-fix + run_mode (+ optional annotation), then zip the
+    outputs. Progress goes to <job_dir>/status.json; a <job_dir>/cancel file
+    stops the job at the next stage boundary or, while translating, before the
+    next page unit. With a cache_key, translated PDFs
+    are reused from / stored to the result cache, so only annotation and
+    packaging run again for a known (input, pipeline options) pair.
+    annot_workers bounds the annotation pool this worker starts (1: none).
+    """
+    timings: Dict[str, float] = {}
+    t_stage = [time.perf_counter(), None]
+
+    def stage(name: str) -> None:
+        if name != "done": _check_cancel(job_dir)
+        now = time.perf_counter()
+        if t_stage[1] is not None:
+            timings[t_stage[1]] = round(now - t_stage[0], 3)
+        t_stage[0], t_stage[1] = now, name
+        write_status(job_dir, state="running", stage=name, progress=STAGE_PROGRESS[name],
+                     timings=timings, pid=os.getpid())
+
+    if cache_key is None: cache = None
+    elif cache is None: cache = ResultCache()
+    hit = cache.get_pdfs(cache_key, job_dir) if cache else None
+    if hit:
+        pdfs, zip_name = [Path(p) for p in hit[0]], hit[1]
+        write_status(job_dir, cached="translation")
+    else:
+        pdfs, zip_name = _translate_to_pdfs(job_dir, input_pdf, opts, stage)
+        if cache: cache.put_pdfs(cache_key, [str(p) for p in pdfs], zip_name)
+    workdir = Path(job_dir)
+
+    annotated: List[Any] = []
+    annot = opts.get("annotate"); annot_failed = False
+    if annot:
+        if hit or opts["mode"] == "all":
+            stage("annotate")
+            try:
+                annotated = annotate_pdf_files(pdfs, workers=annot_workers, **annot)
+            except Exception as e:
+                write_status(job_dir, warning=f"Failed to auto-generate annotations: {e}")
+        else:
+            annotated = [a for a in map(_annotated_outputs, pdfs) if a]
+        annot_failed = len(annotated) != len(pdfs)
+        if annot_failed and "warning" not in read_status(job_dir):
+            write_status(job_dir, warning="Failed to auto-generate annotations for some outputs.")
+        if annotated:
+            zip_name = zip_name.replace(".zip", ".with_annotations.zip")
+    annotate_timings = {Path(a).name: round(dt, 3) for a, _, dt in annotated if dt is not None}
+
+    # Package results (original + annotated, if any)
+    stage("package")
+    zip_path = workdir / zip_name
+    members = list(pdfs) + [a for a, _, _ in annotated] + [j for _, j, _ in annotated if j]
+    _, zip_bytes = write_zip(str(zip_path), [(str(m), Path(m).name) for m in members])
+
+    if cache and not annot_failed: cache.put_zip(cache_key, options_fingerprint(annot), str(zip_path), zip_name)
+
+    stage("done")
+    result = {"zip": str(zip_path), "zip_name": zip_name, "zip_bytes": zip_bytes,
+              "pdfs": [str(p) for p in pdfs], "timings": timings,
+              "annotate_timings": annotate_timings, "worker": note_job()}
+    write_status(job_dir, state="done", result=result, finished=time.time())
+    return result
+
+# ------------------ parent side ------------------
+class JobManager:
+    """
+    Bounded pool of worker processes running translation jobs.
+    submit() returns a job id immediately; status()/cancel() are cheap and safe
+    to call from a UI thread. Share one instance across all users.
+    """
+    def __init__(self, max_workers: int = DEFAULT_JOB_WORKERS, root: str = JOB_ROOT,
+                 max_age_s: float = JOB_MAX_AGE_S, cache: Optional[ResultCache] = None,
+                 prewarm: bool = True, annot_workers: int = JOB_ANNOT_WORKERS):
+        self.max_workers = max(1, int(max_workers))
+        self.annot_workers = max(1, int(annot_workers))
+        self.root = root; self.max_age_s = max_age_s
+        self.cache = cache if cache is not None else ResultCache()
+        os.makedirs(self.root, exist_ok=True)
+        # spawn: the Streamlit server is multi-threaded, fork is not safe there.
+        # Workers preload imports, fonts and the translator once (warm_worker) and
+        # are reused for every job; prewarm starts them all before the first job.
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=mp.get_context("spawn"),
+                                         initializer=warm_worker)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._worker_stats: Dict[int, Dict[str, Any]] = {}  # pid -> latest warm/job stats
+        if prewarm:
+            for _ in range(self.max_workers):
+                self._pool.submit(warm_ping).add_done_callback(self._note_worker)
+
+    def submit(self, pdf_bytes: bytes, opts: Dict[str, Any], filename: str = "input.pdf") -> str:
+        self.cleanup()
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = os.path.join(self.root, job_id)
+        os.makedirs(job_dir)
+        write_status(job_dir, state="queued", stage="queued", progress=0.0,
+                     filename=filename, submitted=time.time())
+
+        cache_key = None
+        if self.cache.enabled:
+            cache_key = hashlib.sha256(pdf_bytes).hexdigest() + ":" + options_fingerprint(opts, exclude=("annotate",))
+            glossary = active_glossary()  # server-side ($PDF_TRANSLATE_GLOSSARY), read by the workers too
+            if glossary is not None: cache_key += ":" + glossary.digest
+            hit = self.cache.get_zip(cache_key, options_fingerprint(opts.get("annotate")))
+            if hit:
+                fut = Future(); fut.set_result(self._finish_from_cache(job_dir, cache_key, *hit))
+                with self._lock:
+                    self._jobs[job_id] = {"dir": job_dir, "future": fut, "submitted": time.time()}
+                return job_id
+        fut = self._pool.submit(run_translation_job, job_dir, pdf_bytes, opts, cache_key, self.cache,
+                                self.annot_workers)
+        fut.add_done_callback(self._note_worker)
+        with self._lock:
+            self._jobs[job_id] = {"dir": job_dir, "future": fut, "submitted": time.time()}
+        return job_id
+
+    def _finish_from_cache(self, job_dir: str, cache_key: str, zip_path: str, zip_name: str) -> Dict[str, Any]:
+        """Same result + zip as an earlier identical job, without touching the pool."""
+        dst = os.path.join(job_dir, zip_name)
+        try:
+            os.link(zip_path, dst)
+        except OSError:
+            shutil.copy2(zip_path, dst)
+        pdfs = (self.cache.get_pdfs(cache_key, job_dir) or ([], ""))[0]
+        result = {"zip": dst, "zip_name": zip_name, "pdfs": pdfs, "timings": {}}
+        write_status(job_dir, state="done", stage="done", progress=1.0, cached="result",
+                     result=result, finished=time.time())
+        return result
+
+    def _note_worker(self, fut: Future) -> None:
+        if fut.cancelled() or fut.exception() is not None: return
+        st = fut.result().get("worker", fut.result())  # a job result, or warm_ping's stats
+        if st.get("pid") is None: return
+        with self._lock:
+            prev = self._worker_stats.get(st["pid"])
+            if prev is None or st["jobs"] >= prev["jobs"]: self._worker_stats[st["pid"]] = st
+
+    def worker_stats(self) -> Dict[str, Any]:
+        """Preload cost of the pool's workers and what it amounts to per job run so far."""
+        with self._lock:
+            return summarize_workers(list(self._worker_stats.values()))
+
+    def pending(self) -> int:
+        """Jobs submitted but not finished yet (queued + running)."""
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if not j["future"].done())
+
+    def status(self, job_id: str) -> Dict[str, Any]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return {"state": "unknown"}
+        st = read_status(job["dir"]); fut = job["future"]
+        st["job_id"] = job_id
+        if fut.cancelled():
+            st["state"] = "cancelled"
+        elif fut.done():
+            exc = fut.exception()
+            if exc is None:
+                st.update(state="done", progress=1.0, result=fut.result())
+            elif isinstance(exc, JobCancelled):
+                st["state"] = "cancelled"
+            else:
+                st.update(state="failed", error=f"{type(exc).__name__}: {exc}")
+        elif st.get("state") == "queued":
+            with self._lock:
+                ahead = [j for j in self._jobs.values()
+                         if j["submitted"] < job["submitted"] and not j["future"].done()]
+            st["queue_position"] = max(1, len(ahead) - self.max_workers + 1)
+        return st
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued job outright, or stop a running one before its next stage or translated unit."""
+        job = self._jobs.get(job_id)
+        if job is None or job["future"].done():
+            return False
+        Path(job["dir"], "cancel").touch()
+        job["future"].cancel()
+        return True
+
+    def result_path(self, job_id: str) -> Optional[str]:
+        st = self.status(job_id)
+        return st.get("result", {}).get("zip") if st.get("state") == "done" else None
+
+    def cleanup(self) -> None:
+        """Forget and delete finished jobs older than max_age_s."""
+        now = time.time()
+        with self._lock:
+            stale = [jid for jid, j in self._jobs.items()
+                     if j["future"].done() and now - j["submitted"] > self.max_age_s]
+            for jid in stale:
+                shutil.rmtree(self._jobs.pop(jid)["dir"], ignore_errors=True)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -1,7 +1,7 @@
 import fitz, subprocess, shutil, os
 
-def rasterize_pdf_to_image_pdf(input_path: str, dpi: int = 300) -> str:
-    doc = fitz.open(input_path); tmp_dir = "temp"; os.makedirs(tmp_dir, exist_ok=True)
+def rasterize_pdf_to_image_pdf(input_path: str, dpi: int = 300, tmp_dir: str = "temp") -> str:
+    doc = fitz.open(input_path); os.makedirs(tmp_dir, exist_ok=True)
     out_path = os.path.join(tmp_dir, "rasterized.pdf")
     out = fitz.open(); zoom = dpi/72.0; mat = fitz.Matrix(zoom, zoom)
     try:
@@ -14,11 +14,11 @@ def rasterize_pdf_to_image_pdf(input_path: str, dpi: int = 300) -> str:
         out.close(); doc.close()
     return out_path
 
-def ocr_fix_pdf(input_path: str, lang: str, dpi: str, optimize: str) -> str:
+def ocr_fix_pdf(input_path: str, lang: str, dpi: str, optimize: str, out_dir: str = "temp") -> str:
     if shutil.which("ocrmypdf") is None:
         print("[ocrmypdf] not found; using original.")
         return input_path
-    out_dir = "temp"; os.makedirs(out_dir, exist_ok=True)
+    os.makedirs(out_dir, exist_ok=True)
     output_path = os.path.join(out_dir, "ocr_fixed.pdf")
     cmd = [
         "ocrmypdf", "--language", lang, "--deskew", "--rotate-pages", "--force-ocr",
@@ -31,7 +31,7 @@ def ocr_fix_pdf(input_path: str, lang: str, dpi: str, optimize: str) -> str:
         print("[ocrmypdf] success ->", output_path); return output_path
     print("[ocrmypdf] failed; fallback to rasterize.\nSTDERR:\n", proc.stderr)
     try:
-        image_pdf = rasterize_pdf_to_image_pdf(input_path, dpi=300)
+        image_pdf = rasterize_pdf_to_image_pdf(input_path, dpi=300, tmp_dir=out_dir)
     except Exception as e:
         print("[fallback] rasterize failed:", e); return input_path
     output_path2 = os.path.join(out_dir, "ocr_fixed_from_image.pdf")
@@ -1,7 +1,6 @@
-from typing import Tuple, List, Dict, Optional, Any
+from typing import Tuple, List, Dict, Optional, Any, Callable
 from pathlib import Path
 from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
 from .utils import rect_iou, rect_center, _rel_luminance, point_in_rect, _to_rgb, Span, _dominant_script
 from .constants import _DEV, _LAT
 from .textlayer import extract_spans_from_textlayer, map_block_styles_from_spans, translate_text#,  derive_block_styles_from_spans
@@ -26,6 +25,11 @@ def overlay_load_items(json_path: str) -> List[Dict[str, Any]]:
         })
     return items
 
+def overlay_items_for_pages(items: List[Dict[str, Any]], pages: List[int]) -> List[Dict[str, Any]]:
+    """Items of the selected source pages, renumbered to their index in the page subset."""
+    remap = {old: new for new, old in enumerate(pages)}
+    return [dict(it, page=remap[int(it["page"])]) for it in items if int(it["page"]) in remap]
+
 def overlay_transform_rect(b: Tuple[float, float, float, float],
                            scale_x: float = 1.0, scale_y: float = 1.0,
                            off_x: float = 0.0, off_y: float = 0.0) -> fitz.Rect:
@@ -60,6 +64,7 @@ def overlay_draw_text_as_image(page: fitz.Page,
     """
     if not text or rect.is_empty:
         return
+    from PIL import Image, ImageDraw, ImageFont  # only image overlays need PIL
 
     # Compute pixel size from PDF points at target DPI
     W = max(1, int(round(rect.width  / 72.0 * target_dpi)))
@@ -223,7 +228,8 @@ def build_overlay_items_from_doc_v2(doc: fitz.Document,
 
 
 def build_overlay_items_from_doc(doc: fitz.Document,
-                                 translate_direction: str) -> List[Dict[str, Any]]:
+                                 translate_direction: str,
+                                 check_cancel: Optional[Callable[[], None]] = None) -> List[Dict[str, Any]]:
 
     # 1) Extract structure and sample styles
     spans_for_style = extract_spans_from_textlayer(doc)
@@ -234,6 +240,7 @@ def build_overlay_items_from_doc(doc: fitz.Document,
 
     # 2) Iterate blocks/segments and translate per 'translate_direction'
     for bl in blocks:
+        if check_cancel: check_cancel()
         # decide language direction (block-level is stable)
         if translate_direction in ("hi->en", "en->hi"):
             sl, dl = translate_direction.split("->", 1)
@@ -1,16 +1,44 @@
-from typing import List, Tuple, Dict, Optional, Any
-import fitz, os, zipfile, statistics
-from .utils import Span, pick_redact_fill_for_color, insert_text_fit, _dominant_script
+from typing import List, Tuple, Dict, Optional, Any, Callable
+import fitz, os, statistics, time
+from concurrent.futures import ProcessPoolExecutor
+from .utils import Span, pick_redact_fill_for_color, insert_text_fit, _dominant_script, build_base, coalesce_rects, save_pdf, pdf_bytes, reopenable_source, open_pdf, PdfSource, FontBook, write_zip, stitched_garbage
 from .constants import _DEV
-from .textlayer import extract_blocks_from_textlayer, extract_lines_from_textlayer, extract_spans_from_textlayer, derive_line_styles_from_spans, derive_block_styles_from_spans, transfer_color_size_from_original, translate_text
-from .overlay import overlay_choose_fontfile_for_text, overlay_draw_text_as_image, overlay_transform_rect, dominant_text_fill_for_rect
-from .hybrid import extract_blocks_with_segments, is_table_like, build_columns
+from .textlayer import extract_blocks_from_textlayer, extract_lines_from_textlayer, extract_spans_from_textlayer, derive_line_styles_from_spans, derive_block_styles_from_spans, transfer_color_size_from_original, unit_counts
+from .overlay import overlay_choose_fontfile_for_text, overlay_draw_text_as_image, overlay_transform_rect, dominant_text_fill_for_rect, overlay_items_for_pages
+from .hybrid import extract_blocks_with_segments, is_table_like, build_columns, column_lookup
+from .highlight_boxes import annotate_open_doc, annotate_pdf_files
+from .repeats import RepeatMemo, Placement, find_repeats
+from .context import build_context_blocks, context_placements, translate_in_context
+
+def erase_page_rects(page: fitz.Page, rects_by_fill: Dict[Tuple[float, ...], List[fitz.Rect]],
+                     erase_mode: str) -> None:
+    """
+    Erase one page's rects, grouped by fill color. Rects are coalesced first;
+    mask draws everything through a single Shape, redact applies once per page.
+    """
+    if erase_mode == "mask":
+        sh = page.new_shape()
+        for fill, rects in rects_by_fill.items():
+            for r in coalesce_rects(rects):
+                sh.draw_rect(r)
+            sh.finish(color=None, fill=fill, width=0)
+        sh.commit(overlay=True)
+    elif erase_mode == "redact":
+        for fill, rects in rects_by_fill.items():
+            for r in coalesce_rects(rects):
+                page.add_redact_annot(r, fill=fill)
+        try:
+            page.apply_redactions()
+        except Exception as e:
+            print(f"[page {page.number}] apply_redactions error: {e}")
 
-def erase_original_text(out_doc: fitz.Document, spans: List[Span], mode: str, erase_mode: str, _unused_fill):
+def erase_original_text(out_doc: fitz.Document, spans: List[Span], mode: str, erase_mode: str, _unused_fill,
+                        check_cancel: Optional[Callable[[], None]] = None):
     """
     Dynamic per-span fill:
       - if span text color is light -> redact black
       - else -> redact white
+    check_cancel, if given, is called before each page.
     """
     if erase_mode not in ("mask", "redact"):
         return
@@ -20,40 +48,158 @@ def erase_original_text(out_doc: fitz.Document, spans: List[Span], mode: str, er
         spans_by_page.setdefault(sp.page, []).append(sp)
 
     for pno, sps in spans_by_page.items():
+        if check_cancel: check_cancel()
         page = out_doc[pno]
-        if erase_mode == "mask":
-            for sp in sps:
-                pad = max(1.0, 0.18 * sp.fontsize)
-                r = fitz.Rect(*sp.rect)
-                r = fitz.Rect(r.x0 - pad, r.y0 - pad, r.x1 + pad, r.y1 + pad) & page.rect
-                if r.is_empty:
-                    continue
-                fill = pick_redact_fill_for_color(sp.color)
-                page.draw_rect(r, color=None, fill=fill, overlay=True, width=0)
+        rects_by_fill: Dict[Tuple[float, ...], List[fitz.Rect]] = {}
+        for sp in sps:
+            pad = max(1.0, 0.18 * sp.fontsize)
+            r = fitz.Rect(*sp.rect)
+            r = fitz.Rect(r.x0 - pad, r.y0 - pad, r.x1 + pad, r.y1 + pad) & page.rect
+            if r.is_empty:
+                continue
+            rects_by_fill.setdefault(pick_redact_fill_for_color(sp.color), []).append(r)
+        if rects_by_fill:
+            erase_page_rects(page, rects_by_fill, erase_mode)
+
+PARALLEL_MODES = ("span", "line", "block", "hybrid")
+
+def repeat_placements(mode: str, src: fitz.Document,
+                      block_context: bool = False) -> Tuple[List[Placement], Optional[List[Placement]]]:
+    """
+    The units mode translates, as (page, rect, text): spans, lines, blocks or
+    hybrid blocks/cells; with block_context, the span/line groups sent per block,
+    plus the spans/lines painted from them (else None: the same units).
+    """
+    if mode in ("span", "line"):
+        keys: List[Tuple[int, int, int]] = []
+        extract = extract_spans_from_textlayer if mode == "span" else extract_lines_from_textlayer
+        units = extract(src, keys=keys)
+        painted = [(u.page, u.rect, u.text) for u in units]
+        if block_context:
+            return context_placements(build_context_blocks(units, keys)), painted
+        return painted, None
+    if mode == "block":
+        return [(bl.page, bl.rect, bl.text) for bl in extract_blocks_from_textlayer(src)], None
+    return hybrid_placements(extract_blocks_with_segments(src)), None
+
+def hybrid_placements(hblocks) -> List[Placement]:
+    out: List[Placement] = []
+    for bl in hblocks:
+        if is_table_like(bl):
+            out.extend((bl.page, seg.rect, seg.text) for ln in bl.lines for seg in ln.segments)
         else:
-            added_any = False
-            for sp in sps:
-                pad = max(1.0, 0.18 * sp.fontsize)
-                r = fitz.Rect(*sp.rect)
-                r = fitz.Rect(r.x0 - pad, r.y0 - pad, r.x1 + pad, r.y1 + pad) & page.rect
-                if r.is_empty:
-                    continue
-                fill = pick_redact_fill_for_color(sp.color)
-                page.add_redact_annot(r, fill=fill)
-                added_any = True
-            if added_any:
-                try:
-                    page.apply_redactions()
-                except Exception as e:
-                    print(f"[page {pno}] apply_redactions error: {e}")
+            out.append((bl.page, bl.rect, bl.text))
+    return out
+
+def report_translation(label: str, counts: Dict[str, int]) -> None:
+    """Print the pass-through share and translation-memory hit rate of one run (see unit_counts)."""
+    units = counts.get("units", 0)
+    if not units: return
+    passed = counts["passed"]
+    print(f"[filter {label}] {passed}/{units} units passed through untranslated "
+          f"({100.0 * passed / units:.1f}%)")
+    lookups = units - passed
+    hits = counts["tm_exact"] + counts["tm_template"]
+    if lookups:
+        print(f"[tm {label}] {hits}/{lookups} memory hits ({100.0 * hits / lookups:.1f}%; "
+              f"{counts['tm_template']} via placeholders), {counts['calls']} translator calls")
+    if counts.get("glossary"):
+        print(f"[glossary {label}] fixed terms enforced in {counts['glossary']} units")
+    if counts.get("repeat_hits") or counts.get("fit_reused"):
+        # the translation memory already answers exact repeats: the memo's gain is the fitting
+        print(f"[repeats {label}] {counts.get('fit_reused', 0)} font-size searches skipped, "
+              f"{counts['repeat_hits']} units painted from the memo's translation "
+              f"({counts['repeat_calls']} translator calls avoided)")
+
+def split_page_ranges(n_pages: int, workers: int) -> List[List[int]]:
+    """Split 0..n_pages-1 into at most `workers` contiguous, near-equal page ranges."""
+    workers = max(1, min(int(workers), n_pages))
+    step, extra = divmod(n_pages, workers)
+    ranges, start = [], 0
+    for i in range(workers):
+        end = start + step + (1 if i < extra else 0)
+        if end > start: ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+def _paint_page_range(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Worker: open the source itself, keep only job['pages'] and paint them with
+    the regular single-process run_mode; the partial PDF comes back as bytes.
+    """
+    t0 = time.perf_counter()
+    pages = job["pages"]
+    remap = {old: new for new, old in enumerate(pages)}
+    s, o = build_base(job["src"], pages=pages)
+    kwargs = dict(job["kwargs"])
+    if kwargs["orig_index"] is not None:
+        kwargs["orig_index"] = {remap[p]: v for p, v in kwargs["orig_index"].items() if p in remap}
+    if kwargs.get("overlay_items"):
+        kwargs["overlay_items"] = overlay_items_for_pages(kwargs["overlay_items"], pages)
+    data = run_mode(mode=job["mode"], src=s, out=o, output_pdf=None, workers=1, **kwargs)
+    return {"index": job["index"], "pages": pages, "pdf": data, "units": unit_counts(),
+            "seconds": time.perf_counter() - t0, "pid": os.getpid()}
+
+def _run_mode_parallel(mode: str, src: PdfSource, n_pages: int, output_pdf: Optional[str],
+                       workers: int, kwargs: Dict[str, Any], save_profile: str = "fast",
+                       annotate: Optional[Dict[str, Any]] = None) -> Optional[bytes]:
+    """Fan disjoint page ranges out to a process pool and assemble the partial PDFs in page order."""
+    jobs = [{"index": i, "pages": pages, "mode": mode, "src": src, "kwargs": kwargs}
+            for i, pages in enumerate(split_page_ranges(n_pages, workers))]
+
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=len(jobs)) as ex:
+        results = sorted(ex.map(_paint_page_range, jobs), key=lambda r: r["index"])
+    t_paint = time.perf_counter() - t0
+
+    counts = unit_counts(reset=True)  # parent's share: recurring text translated up front
+    for r in results:
+        for k, v in r["units"].items(): counts[k] = counts.get(k, 0) + v
+    report_translation(mode, counts)
+
+    final = fitz.open()
+    for r in results:
+        with open_pdf(r["pdf"]) as part:
+            final.insert_pdf(part)
+        print(f"[parallel {mode}] worker {r['index']} (pid {r['pid']}) pages "
+              f"{r['pages'][0] + 1}-{r['pages'][-1] + 1}: {r['seconds']:.2f}s")
+    # every part embeds its own copy of the fonts: merge identical objects on save
+    data = _finish_output(final, None, output_pdf, save_profile, annotate, garbage=stitched_garbage(save_profile))
+    print(f"[parallel {mode}] {len(jobs)} workers, paint {t_paint:.2f}s, "
+          f"assemble {time.perf_counter() - t0 - t_paint:.2f}s")
+    return data
+
+def _finish_output(out: fitz.Document, src: Optional[fitz.Document], output_pdf: Optional[str],
+                   save_profile: str, annotate: Optional[Dict[str, Any]] = None,
+                   garbage: Optional[int] = None) -> Optional[bytes]:
+    """
+    Save out to output_pdf, or serialize it in memory when output_pdf is None; closes both docs.
+    With annotate settings, the still-open out is then boxed and saved as '<stem>.annot.pdf'.
+    """
+    data = None
+    if output_pdf is None:
+        data = pdf_bytes(out, save_profile, garbage)
+    else:
+        save_pdf(out, output_pdf, save_profile, garbage)
+        if annotate:
+            try:
+                annot_pdf, _, dt = annotate_open_doc(out, output_pdf, annotate)
+                print(f"[annotate] {dt:.2f}s -> {annot_pdf}")
+            except Exception as e:
+                print(f"[WARN] annotation failed for {output_pdf}: {e}")
+    out.close()
+    if src is not None: src.close()
+    if output_pdf is not None:
+        print(f"[OK] Wrote translated PDF to: {output_pdf}")
+    return data
 
 def run_mode(mode: str, src: fitz.Document, out: fitz.Document,
-             orig_index: Dict[int, List[Dict[str, Any]]],
+             orig_index: Optional[Dict[int, List[Dict[str, Any]]]],
              translate_dir: str,
              erase_mode: str, redact_color: Tuple[float,...],
              font_en_name: str, font_en_file: Optional[str],
              font_hi_name: str, font_hi_file: Optional[str],
-             output_pdf: str,
+             output_pdf: Optional[str],
              # ----- overlay parameters -----
              overlay_items: Optional[List[Dict[str, Any]]] = None,
              overlay_render: str = "image",     # "image" | "textbox"
@@ -62,19 +208,78 @@ def run_mode(mode: str, src: fitz.Document, out: fitz.Document,
              overlay_margin_px: float = 0.1,
              overlay_target_dpi: int = 600,
              overlay_scale_x: float = 1.0, overlay_scale_y: float = 1.0,
-             overlay_off_x: float = 0.0, overlay_off_y: float = 0.0) -> None:
+             overlay_off_x: float = 0.0, overlay_off_y: float = 0.0,
+             workers: int = 1,
+             save_profile: str = "fast",
+             annotate: Optional[Dict[str, Any]] = None,
+             repeats: Optional[RepeatMemo] = None,
+             block_context: bool = False,
+             check_cancel: Optional[Callable[[], None]] = None,
+             package: bool = True) -> Optional[bytes]:
     """
     - span/line/block/hybrid: style-preserving translation and draw.
     - overlay: paint from prebuilt JSON items.
-    - all: run span, line, block, hybrid, and (if provided) overlay; zip results.
+    - all: run span, line, block, hybrid, and (if provided) overlay; zip results
+      (package=False: leave the zip to the caller, e.g. a job packaging its own).
+    - orig_index=None: src is itself the style source (no OCR), so span colors and
+      sizes are taken as extracted and the original-style matching is skipped.
+    - workers > 1: span/line/block/hybrid pages are painted by a process pool
+      (each worker reopens src and paints a disjoint page range).
+    - save_profile: 'fast' | 'compact' | 'web' (see utils.save_pdf).
+    - output_pdf=None (single modes): nothing is written, the PDF bytes are returned.
+    - annotate: highlight_boxes settings; each saved output also gets a boxed
+      '<stem>.annot.pdf', drawn on the open document (no reopen/re-parse). In
+      "all" mode the outputs are annotated afterwards on a process pool instead.
+    - repeats: recurring text (headers, footers, page labels) found beforehand;
+      by default each mode fingerprints its own units. Recurring text is
+      translated once and painted from the cached translation and font size.
+    - block_context (span/line): translate each text-layer block in one request,
+      lines joined by a '\n' marker, and project the result back onto the
+      line/span rects (by marker, else by length ratio); painting is unchanged.
+    - check_cancel: called before every unit is translated/painted (and between
+      the sub-modes of "all"); raising from it aborts the run. Page-range workers
+      get it too, so it must be picklable (e.g. a functools.partial).
     """
+    tick = check_cancel or (lambda: None)
+
+    # ======================= PAGE-PARALLEL =======================
+    if workers > 1 and mode in PARALLEL_MODES and len(src) > 1:
+        src_source = reopenable_source(src)
+        n_pages = len(src)
+        # Recurring text is found over the whole document and translated here,
+        # once, so workers painting different page ranges share it.
+        unit_counts(reset=True)
+        if repeats is None:
+            placements, painted = repeat_placements(mode, src, block_context)
+            repeats = find_repeats(placements, translate_dir, label=mode, fit_placements=painted)
+            tick()
+            repeats.prefetch(placements)
+        try:
+            out.close()
+        except Exception:
+            pass
+        src.close()
+        return _run_mode_parallel(mode, src_source, n_pages, output_pdf, workers, dict(
+            orig_index=orig_index, translate_dir=translate_dir,
+            erase_mode=erase_mode, redact_color=redact_color,
+            font_en_name=font_en_name, font_en_file=font_en_file,
+            font_hi_name=font_hi_name, font_hi_file=font_hi_file,
+            overlay_items=overlay_items, overlay_render=overlay_render,
+            overlay_align=overlay_align, overlay_line_spacing=overlay_line_spacing,
+            overlay_margin_px=overlay_margin_px, overlay_target_dpi=overlay_target_dpi,
+            overlay_scale_x=overlay_scale_x, overlay_scale_y=overlay_scale_y,
+            overlay_off_x=overlay_off_x, overlay_off_y=overlay_off_y,
+            repeats=repeats, block_context=block_context, check_cancel=check_cancel,
+        ), save_profile=save_profile, annotate=annotate)
 
     # ======================= "ALL" MODE =======================
     if mode == "all":
-        src_path = getattr(src, "name", None)
-        if not src_path or not os.path.exists(src_path):
-            raise ValueError("all mode requires 'src' to come from a real file (src.name must exist).")
+        if output_pdf is None:
+            raise ValueError("all mode writes one PDF per method; output_pdf is required.")
+        src_source = reopenable_source(src)
 
+        # Snapshot the caller's base once; every sub-mode reopens it from memory.
+        base_bytes = out.tobytes()
         try:
             out.close()
         except Exception:
@@ -91,14 +296,10 @@ def run_mode(mode: str, src: fitz.Document, out: fitz.Document,
             return f"{base}.{label}{ext}"
 
         def _fresh_src_out() -> Tuple[fitz.Document, fitz.Document]:
-            s = fitz.open(src_path)
-            o = fitz.open()
-            for p in range(len(s)):
-                po = o.new_page(width=s[p].rect.width, height=s[p].rect.height)
-                po.show_pdf_page(po.rect, s, p)
-            return s, o
+            return open_pdf(src_source), fitz.open("pdf", base_bytes)
 
         for sub_mode in ("span", "line", "block", "hybrid"):
+            tick()
             try:
                 s, o = _fresh_src_out()
                 run_mode(
@@ -108,12 +309,16 @@ def run_mode(mode: str, src: fitz.Document, out: fitz.Document,
                     font_en_name=font_en_name, font_en_file=font_en_file,
                     font_hi_name=font_hi_name, font_hi_file=font_hi_file,
                     output_pdf=_make_output(sub_mode),
+                    workers=workers, save_profile=save_profile, block_context=block_context,
+                    check_cancel=check_cancel,
                 )
                 out_files.append((sub_mode, _make_output(sub_mode)))
             except Exception as e:
+                tick()  # a cancel inside the sub-mode stops "all" too
                 print(f"[WARN] {sub_mode} failed: {e}")
 
         if overlay_items:
+            tick()
             try:
                 s, o = _fresh_src_out()
                 run_mode(
@@ -128,29 +333,51 @@ def run_mode(mode: str, src: fitz.Document, out: fitz.Document,
                     overlay_margin_px=overlay_margin_px, overlay_target_dpi=overlay_target_dpi,
                     overlay_scale_x=overlay_scale_x, overlay_scale_y=overlay_scale_y,
                     overlay_off_x=overlay_off_x, overlay_off_y=overlay_off_y,
+                    save_profile=save_profile, check_cancel=check_cancel,
                 )
                 out_files.append(("overlay", _make_output("overlay")))
             except Exception as e:
+                tick()
                 print(f"[WARN] overlay failed: {e}")
         else:
             print("[info] overlay skipped in 'all' mode (no overlay_items provided).")
 
+        # Annotate the finished outputs side by side (one per pool worker) instead
+        # of inline after each sub-mode.
+        if annotate and out_files:
+            try:
+                t0 = time.perf_counter()
+                results = annotate_pdf_files([path for _, path in out_files], **annotate)
+                for (label, _), (annot_pdf, _, dt) in zip(out_files, results):
+                    print(f"[annotate {label}] {dt:.2f}s -> {annot_pdf}")
+                print(f"[annotate] {len(results)} outputs in {time.perf_counter() - t0:.2f}s")
+            except Exception as e:
+                print(f"[WARN] annotation failed: {e}")
+
+        if not package:
+            print(f"[OK] Wrote {len(out_files)} PDFs (not zipped)")
+            return
         zip_path = f"{base}_all_methods.zip"
-        os.makedirs(os.path.dirname(zip_path) or ".", exist_ok=True)
-        with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-            for label, path in out_files:
-                if os.path.exists(path):
-                    arc = os.path.basename(path)
-                    zf.write(path, arcname=arc)
-                else:
-                    print(f"[WARN] missing output for {label}: {path}")
+        members = []
+        for label, path in out_files:
+            if os.path.exists(path):
+                members.append((path, os.path.basename(path)))
+            else:
+                print(f"[WARN] missing output for {label}: {path}")
+        write_zip(zip_path, members)
 
         print(f"[OK] Wrote {len(out_files)} PDFs and zipped -> {zip_path}")
         return
 
+    # Each font is registered once per output page, then referenced by name.
+    fonts = FontBook()
+    unit_counts(reset=True)
+
     # --------- Shared: spans (for style/erase in non-overlay modes) ----------
-    spans = extract_spans_from_textlayer(src)
-    transfer_color_size_from_original(spans, orig_index)
+    span_keys: List[Tuple[int, int, int]] = []
+    spans = extract_spans_from_textlayer(src, keys=span_keys)
+    if orig_index is not None:
+        transfer_color_size_from_original(spans, orig_index)
 
     # ======================= OVERLAY MODE =======================
     if mode == "overlay":
@@ -162,7 +389,7 @@ def run_mode(mode: str, src: fitz.Document, out: fitz.Document,
             for sp in spans:
                 spans_by_page.setdefault(sp.page, []).append(sp)
 
-            redacted_pages = set()
+            pending: Dict[int, Dict[Tuple[float, ...], List[fitz.Rect]]] = {}
             for it in overlay_items:
                 pno = int(it["page"])
                 if pno < 0 or pno >= len(out):
@@ -176,22 +403,15 @@ def run_mode(mode: str, src: fitz.Document, out: fitz.Document,
                     continue
 
                 fill = dominant_text_fill_for_rect(pno, r, spans_by_page)
+                pending.setdefault(pno, {}).setdefault(fill, []).append(r)
 
-                if erase_mode == "mask":
-                    page.draw_rect(r, color=None, fill=fill, overlay=True, width=0)
-                else:
-                    page.add_redact_annot(r, fill=fill)
-                    redacted_pages.add(pno)
-
-            if erase_mode == "redact":
-                for pno in redacted_pages:
-                    try:
-                        out[pno].apply_redactions()
-                    except Exception as e:
-                        print(f"[page {pno}] apply_redactions error: {e}")
+            for pno, rects_by_fill in pending.items():
+                tick()
+                erase_page_rects(out[pno], rects_by_fill, erase_mode)
 
         # Draw each overlay item (image or textbox)
         for it in overlay_items:
+            tick()
             pno = int(it["page"])
             if pno < 0 or pno >= len(out):
                 continue
@@ -223,18 +443,17 @@ def run_mode(mode: str, src: fitz.Document, out: fitz.Document,
                     fname, ffile = font_en_name, font_en_file
                 insert_text_fit(
                     page, (rect.x0, rect.y0, rect.x1, rect.y1),
-                    text, fname, base_fs, (0.0,), fontfile=ffile
+                    text, fname, base_fs, (0.0,), fontfile=ffile, fonts=fonts
                 )
 
         # Save & close
-        os.makedirs(os.path.dirname(output_pdf) or ".", exist_ok=True)
-        out.save(output_pdf); out.close(); src.close()
-        print(f"[OK] Wrote translated PDF to: {output_pdf}")
-        return
+        return _finish_output(out, src, output_pdf, save_profile, annotate)
 
     if mode == "hybrid":
         hblocks = extract_blocks_with_segments(src)
         derive_block_styles_from_spans(hblocks, spans)
+        if repeats is None:
+            repeats = find_repeats(hybrid_placements(hblocks), translate_dir, label=mode)
 
         # ---- ERASE: dynamic fill, supports both overlay_items and block fallback ----
         if erase_mode in ("mask", "redact"):
@@ -242,7 +461,7 @@ def run_mode(mode: str, src: fitz.Document, out: fitz.Document,
             for sp in spans:
                 spans_by_page.setdefault(sp.page, []).append(sp)
 
-            redacted_pages = set()
+            pending: Dict[int, Dict[Tuple[float, ...], List[fitz.Rect]]] = {}
 
             def _erase_rect(pno: int, r: fitz.Rect, pad_pt: float):
                 page = out[pno]
@@ -250,11 +469,7 @@ def run_mode(mode: str, src: fitz.Document, out: fitz.Document,
                 if rr.is_empty:
                     return
                 fill = dominant_text_fill_for_rect(pno, rr, spans_by_page)
-                if erase_mode == "mask":
-                    page.draw_rect(rr, color=None, fill=fill, overlay=True, width=0)
-                else:
-                    page.add_redact_annot(rr, fill=fill)
-                    redacted_pages.add(pno)
+                pending.setdefault(pno, {}).setdefault(fill, []).append(rr)
 
             if overlay_items:
                 for it in overlay_items:
@@ -276,14 +491,12 @@ def run_mode(mode: str, src: fitz.Document, out: fitz.Document,
                     pad = max(1.0, 0.18 * (bl.fontsize or 11.5))
                     _erase_rect(pno, rect, pad)
 
-            if erase_mode == "redact":
-                for pno in redacted_pages:
-                    try:
-                        out[pno].apply_redactions()
-                    except Exception as e:
-                        print(f"[page {pno}] apply_redactions error: {e}")
+            for pno, rects_by_fill in pending.items():
+                tick()
+                erase_page_rects(out[pno], rects_by_fill, erase_mode)
 
         for bl in hblocks:
+            tick()
             if translate_dir == "hi->en":
                 sl, dl = "hi", "en"
             elif translate_dir == "en->hi":
@@ -294,91 +507,122 @@ def run_mode(mode: str, src: fitz.Document, out: fitz.Document,
 
             page = out[bl.page]
             if is_table_like(bl):
-                cols = build_columns(bl)
-                for ln in bl.lines:
-                    y0, y1 = ln.rect[1], ln.rect[3]
-                    for seg in ln.segments:
-                        text_out = translate_text(seg.text, sl, dl) or ""
-                        if text_out and _DEV.search(text_out):
-                            fname, ffile = font_hi_name, font_hi_file
-                        else:
-                            fname, ffile = font_en_name, font_en_file
-                        try:
-                            base_size = statistics.median(seg.sizes)
-                        except statistics.StatisticsError:
-                            base_size = bl.fontsize
-                        color = bl.color
-                        best_col = max(
-                            cols,
-                            key=lambda c: max(0.0, min(seg.rect[2], c[1]) - max(seg.rect[0], c[0]))
-                        )
-                        cell_rect = (best_col[0], y0, best_col[1], y1)
-                        insert_text_fit(page, cell_rect, text_out, fname, base_size, color, fontfile=ffile)
+                # one batched request per table; columns found by bisecting their sorted starts
+                col_of = column_lookup(build_columns(bl))
+                cells = [(ln, seg) for ln in bl.lines for seg in ln.segments]
+                outs = repeats.translate_many([(seg.text, seg.rect) for _, seg in cells], sl, dl)
+                for (ln, seg), text_out in zip(cells, outs):
+                    text_out = text_out or ""
+                    if text_out and _DEV.search(text_out):
+                        fname, ffile = font_hi_name, font_hi_file
+                    else:
+                        fname, ffile = font_en_name, font_en_file
+                    try:
+                        base_size = statistics.median(seg.sizes)
+                    except statistics.StatisticsError:
+                        base_size = bl.fontsize
+                    best_col = col_of(seg.rect)
+                    cell_rect = (best_col[0], ln.rect[1], best_col[1], ln.rect[3])
+                    insert_text_fit(page, cell_rect, text_out, fname, base_size, bl.color, fontfile=ffile, fonts=fonts,
+                                    fits=repeats.fits_for(seg.text, seg.rect))
             else:
-                text_out = translate_text(bl.text, sl, dl) or ""
+                text_out = repeats.translate(bl.text, bl.rect, sl, dl) or ""
                 if text_out and _DEV.search(text_out):
                     fname, ffile = font_hi_name, font_hi_file
                 else:
                     fname, ffile = font_en_name, font_en_file
-                insert_text_fit(page, bl.rect, text_out, fname, bl.fontsize, bl.color, fontfile=ffile)
+                insert_text_fit(page, bl.rect, text_out, fname, bl.fontsize, bl.color, fontfile=ffile, fonts=fonts,
+                                fits=repeats.fits_for(bl.text, bl.rect))
 
-        os.makedirs(os.path.dirname(output_pdf) or ".", exist_ok=True)
-        out.save(output_pdf); out.close(); src.close()
-        print(f"[OK] Wrote translated PDF to: {output_pdf}")
-        return
+        if output_pdf is not None:  # page-range workers report to the parent instead
+            report_translation(mode, unit_counts())
+        return _finish_output(out, src, output_pdf, save_profile, annotate)
 
-    erase_original_text(out, spans, mode, erase_mode, redact_color)
+    erase_original_text(out, spans, mode, erase_mode, redact_color, check_cancel=tick)
 
     if mode == "span":
-        for sp in spans:
-            if translate_dir == "hi->en": sl, dl = "hi","en"
-            elif translate_dir == "en->hi": sl, dl = "en","hi"
+        context_out = None
+        if block_context:
+            ctx = build_context_blocks(spans, span_keys)
+            if repeats is None:
+                repeats = find_repeats(context_placements(ctx), translate_dir, label=mode,
+                                       fit_placements=[(sp.page, sp.rect, sp.text) for sp in spans])
+            context_out = translate_in_context(ctx, spans, translate_dir, repeats, check_cancel=tick)
+        elif repeats is None:
+            repeats = find_repeats([(sp.page, sp.rect, sp.text) for sp in spans], translate_dir, label=mode)
+        for i, sp in enumerate(spans):
+            tick()
+            if context_out is not None:
+                text_out = context_out[i]
             else:
-                sl = _dominant_script(sp.text); dl = "en" if sl=="hi" else "hi"
-                if sl not in ("hi","en"): sl, dl = "hi","en"
-            text_out = translate_text(sp.text, sl, dl) or ""
+                if translate_dir == "hi->en": sl, dl = "hi","en"
+                elif translate_dir == "en->hi": sl, dl = "en","hi"
+                else:
+                    sl = _dominant_script(sp.text); dl = "en" if sl=="hi" else "hi"
+                    if sl not in ("hi","en"): sl, dl = "hi","en"
+                text_out = repeats.translate(sp.text, sp.rect, sl, dl) or ""
             page = out[sp.page]
             if text_out and _DEV.search(text_out): fname, ffile = font_hi_name, font_hi_file
             else:                                   fname, ffile = font_en_name, font_en_file
-            insert_text_fit(page, sp.rect, text_out, fname, sp.fontsize, sp.color, fontfile=ffile)
+            insert_text_fit(page, sp.rect, text_out, fname, sp.fontsize, sp.color, fontfile=ffile, fonts=fonts,
+                            fits=repeats.fits_for(sp.text, sp.rect))
 
     elif mode == "line":
-        lines = extract_lines_from_textlayer(src)
+        line_keys: List[Tuple[int, int, int]] = []
+        lines = extract_lines_from_textlayer(src, keys=line_keys)
         derive_line_styles_from_spans(lines, spans)
-        for ln in lines:
-            if translate_dir == "hi->en": sl, dl = "hi","en"
-            elif translate_dir == "en->hi": sl, dl = "en","hi"
+        context_out = None
+        if block_context:
+            ctx = build_context_blocks(lines, line_keys)
+            if repeats is None:
+                repeats = find_repeats(context_placements(ctx), translate_dir, label=mode,
+                                       fit_placements=[(ln.page, ln.rect, ln.text) for ln in lines])
+            context_out = translate_in_context(ctx, lines, translate_dir, repeats, check_cancel=tick)
+        elif repeats is None:
+            repeats = find_repeats([(ln.page, ln.rect, ln.text) for ln in lines], translate_dir, label=mode)
+        for i, ln in enumerate(lines):
+            tick()
+            if context_out is not None:
+                text_out = context_out[i]
             else:
-                sl = _dominant_script(ln.text); dl = "en" if sl=="hi" else "hi"
-                if sl not in ("hi","en"): sl, dl = "hi","en"
-            text_out = translate_text(ln.text, sl, dl) or ""
+                if translate_dir == "hi->en": sl, dl = "hi","en"
+                elif translate_dir == "en->hi": sl, dl = "en","hi"
+                else:
+                    sl = _dominant_script(ln.text); dl = "en" if sl=="hi" else "hi"
+                    if sl not in ("hi","en"): sl, dl = "hi","en"
+                text_out = repeats.translate(ln.text, ln.rect, sl, dl) or ""
             page = out[ln.page]
             if text_out and _DEV.search(text_out): fname, ffile = font_hi_name, font_hi_file
             else:                                   fname, ffile = font_en_name, font_en_file
             base_size = ln.fontsize if ln.fontsize else 11.5
             color     = ln.color if ln.color else (0.0,)
-            insert_text_fit(page, ln.rect, text_out, fname, base_size, color, fontfile=ffile)
+            insert_text_fit(page, ln.rect, text_out, fname, base_size, color, fontfile=ffile, fonts=fonts,
+                            fits=repeats.fits_for(ln.text, ln.rect))
 
     elif mode == "block":
         blocks = extract_blocks_from_textlayer(src)
         derive_block_styles_from_spans(blocks, spans)
+        if repeats is None:
+            repeats = find_repeats([(bl.page, bl.rect, bl.text) for bl in blocks], translate_dir, label=mode)
         for bl in blocks:
+            tick()
             if translate_dir == "hi->en": sl, dl = "hi","en"
             elif translate_dir == "en->hi": sl, dl = "en","hi"
             else:
                 sl = _dominant_script(bl.text); dl = "en" if sl=="hi" else "hi"
                 if sl not in ("hi","en"): sl, dl = "hi","en"
-            text_out = translate_text(bl.text, sl, dl) or ""
+            text_out = repeats.translate(bl.text, bl.rect, sl, dl) or ""
             page = out[bl.page]
             if text_out and _DEV.search(text_out): fname, ffile = font_hi_name, font_hi_file
             else:                                   fname, ffile = font_en_name, font_en_file
             base_size = bl.fontsize if bl.fontsize else 11.5
             color     = bl.color if bl.color else (0.0,)
-            insert_text_fit(page, bl.rect, text_out, fname, base_size, color, fontfile=ffile)
+            insert_text_fit(page, bl.rect, text_out, fname, base_size, color, fontfile=ffile, fonts=fonts,
+                            fits=repeats.fits_for(bl.text, bl.rect))
 
     else:
         raise ValueError(f"Unknown mode: {mode}")
 
-    os.makedirs(os.path.dirname(output_pdf) or ".", exist_ok=True)
-    out.save(output_pdf); out.close(); src.close()
-    print(f"[OK] Wrote translated PDF to: {output_pdf}")
\ No newline at end of file
+    if output_pdf is not None:
+        report_translation(mode, unit_counts())
+    return _finish_output(out, src, output_pdf, save_profile, annotate)
\ No newline at end of file
@@ -0,0 +1,116 @@
+from typing import Dict, Iterable, List, Sequence, Tuple, Optional, Any
+from dataclasses import dataclass, field
+
+from .textlayer import translate_text, translate_batch, unit_counts, count_repeat_hit
+from .utils import choose_langs
+
+# (page, rect, text) of one translated unit: a span, line, block or table cell.
+Placement = Tuple[int, Tuple[float, float, float, float], str]
+
+REPEAT_GRID_PT = 6.0    # position tolerance: rects are snapped to this grid
+REPEAT_MIN_PAGES = 2    # a fingerprint must appear on this many pages to count
+
+def normalize_text(text: str) -> str:
+    """Same whitespace folding translate_text applies to its output."""
+    return "\n".join(" ".join(line.split()) for line in (text or "").strip().splitlines())
+
+def layout_fingerprint(text: str, rect, grid: float = REPEAT_GRID_PT) -> Tuple[Any, ...]:
+    return (normalize_text(text),) + tuple(int(round(float(v) / grid)) for v in rect)
+
+@dataclass
+class RepeatMemo:
+    """
+    Text that recurs at about the same place on several pages (letterheads,
+    footers, page labels). Each such fingerprint is translated once; `fits`
+    keeps the font size insert_text_fit settled on, so later copies are
+    painted with a single insert. Picklable, so page-range workers can share it.
+    `fit_recurring` is set when the painted units differ from the translated
+    ones (block_context: blocks are translated, spans/lines painted).
+    """
+    translate_dir: str
+    recurring: Dict[Tuple[Any, ...], int] = field(default_factory=dict)  # fingerprint -> placements
+    translations: Dict[Tuple[Any, ...], str] = field(default_factory=dict)
+    first_calls: Dict[Tuple[Any, ...], int] = field(default_factory=dict)  # translator calls of the first copy
+    fits: Dict[Tuple[Any, ...], float] = field(default_factory=dict)
+    fit_recurring: Optional[Dict[Tuple[Any, ...], int]] = None
+    grid: float = REPEAT_GRID_PT
+
+    def is_recurring(self, text: str, rect) -> bool:
+        return bool(self.recurring) and layout_fingerprint(text, rect, self.grid) in self.recurring
+
+    def translate(self, text: str, rect, sl: str, dl: str) -> str:
+        if not self.recurring:
+            return translate_text(text, sl, dl)
+        fp = layout_fingerprint(text, rect, self.grid)
+        if fp not in self.recurring:
+            return translate_text(text, sl, dl)
+        key = fp + (sl, dl)
+        if key in self.translations:
+            count_repeat_hit(self.first_calls.get(key, 0))
+        else:
+            calls = unit_counts()["calls"]
+            self.translations[key] = translate_text(text, sl, dl)
+            self.first_calls[key] = unit_counts()["calls"] - calls
+        return self.translations[key]
+
+    def translate_many(self, items: Sequence[Tuple[str, Any]], sl: str, dl: str) -> List[str]:
+        """translate() for many (text, rect) units, with one translate_batch for what is not memoized yet."""
+        keys = [layout_fingerprint(t, r, self.grid) + (sl, dl) if self.is_recurring(t, r) else None
+                for t, r in items]
+        todo = [t for (t, _), k in zip(items, keys) if k is None or k not in self.translations]
+        done = dict(zip(todo, translate_batch(todo, sl, dl)))
+        out: List[str] = []
+        for (t, _), k in zip(items, keys):
+            if k is None:
+                out.append(done[t]); continue
+            if k not in self.translations:
+                self.translations[k] = done[t]  # batched: sharing a joined call, so no call to credit
+            elif t not in done:
+                count_repeat_hit(self.first_calls.get(k, 0))
+            out.append(self.translations[k])
+        return out
+
+    def fits_for(self, text: str, rect) -> Optional[Dict[Tuple[Any, ...], float]]:
+        """The fit memo for a painted unit (span, line, block or cell) that recurs, else None."""
+        if self.fit_recurring is None:
+            return self.fits if self.is_recurring(text, rect) else None
+        recurs = bool(self.fit_recurring) and layout_fingerprint(text, rect, self.grid) in self.fit_recurring
+        return self.fits if recurs else None
+
+    def prefetch(self, placements: Iterable[Placement]) -> None:
+        """Translate every recurring fingerprint now (before fanning pages out to workers)."""
+        for _, rect, text in placements:
+            if self.is_recurring(text, rect):
+                sl, dl = choose_langs(text, self.translate_dir)
+                key = layout_fingerprint(text, rect, self.grid) + (sl, dl)
+                if key not in self.translations:
+                    self.translate(text, rect, sl, dl)
+                    # every copy, this one too, is then painted (and counted) from the memo
+                    count_repeat_hit(self.first_calls[key], copies=-1)
+
+def _recurring(placements: Iterable[Placement], min_pages: int, grid: float) -> Dict[Tuple[Any, ...], int]:
+    pages: Dict[Tuple[Any, ...], set] = {}
+    counts: Dict[Tuple[Any, ...], int] = {}
+    for page, rect, text in placements:
+        fp = layout_fingerprint(text, rect, grid)
+        if not fp[0]: continue
+        pages.setdefault(fp, set()).add(page)
+        counts[fp] = counts.get(fp, 0) + 1
+    return {fp: counts[fp] for fp, ps in pages.items() if len(ps) >= min_pages}
+
+def find_repeats(placements: Iterable[Placement], translate_dir: str,
+                 min_pages: int = REPEAT_MIN_PAGES, grid: float = REPEAT_GRID_PT,
+                 label: str = "", fit_placements: Optional[Iterable[Placement]] = None) -> RepeatMemo:
+    """
+    Fingerprint every placement by (normalized text, snapped rect) and keep those
+    seen on min_pages+ pages. fit_placements: the painted units, when they are
+    not the translated ones (fits_for is looked up by them).
+    """
+    memo = RepeatMemo(translate_dir, grid=grid)
+    memo.recurring = _recurring(placements, min_pages, grid)
+    if fit_placements is not None:
+        memo.fit_recurring = _recurring(fit_placements, min_pages, grid)
+    if memo.recurring:
+        print(f"[repeats{' ' + label if label else ''}] {len(memo.recurring)} recurring texts on "
+              f"{sum(memo.recurring.values())} placements")
+    return memo
@@ -0,0 +1,247 @@
+"""
+Headless HTTP API around the job pool (stdlib only, no web framework needed).
+
+  POST   /jobs?mode=block&translate_dir=en->hi   body: the PDF (application/pdf)
+  GET    /jobs/<id>                               status, stage timings
+  GET    /jobs/<id>/result[?file=<name>.pdf]      streams the ZIP (or one PDF)
+  DELETE /jobs/<id>                               cancel
+  GET    /health
+
+    python -m PDF_Translate.server --port 8080 --workers 2
+"""
+from typing import Dict, Any, Optional, Tuple
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import argparse, json, os, time
+
+from .jobs import JobManager, JOB_DEFAULTS, DEFAULT_JOB_WORKERS
+from .utils import SAVE_PROFILES
+
+MAX_UPLOAD_MB = float(os.environ.get("PDF_TRANSLATE_API_MAX_MB", "50"))
+MAX_PENDING_JOBS = int(os.environ.get("PDF_TRANSLATE_API_MAX_PENDING", "32"))
+CHUNK = 256 * 1024
+
+MODES = ("span", "line", "block", "hybrid", "overlay", "all")
+_CHOICES = {
+    "mode": MODES,
+    "translate_dir": ("hi->en", "en->hi", "auto"),
+    "erase_mode": ("redact", "mask", "none"),
+    "overlay_render": ("image", "textbox"),
+    "save_profile": SAVE_PROFILES,
+}
+# Query parameter -> option type; anything else is rejected.
+_PARAM_TYPES = {
+    "mode": str, "translate_dir": str, "erase_mode": str, "lang": str, "dpi": str,
+    "optimize": str, "skip_ocr": bool, "auto_overlay": bool, "overlay_render": str,
+    "overlay_align": int, "overlay_line_spacing": float, "overlay_margin_px": float,
+    "overlay_target_dpi": int, "overlay_scale_x": float, "overlay_scale_y": float,
+    "overlay_off_x": float, "overlay_off_y": float, "save_profile": str,
+    "block_context": bool,
+}
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message); self.status = status
+
+# ------------------ options ------------------
+def _parse_bool(v: str) -> bool:
+    return v.strip().lower() in ("1", "true", "yes", "on")
+
+def parse_job_options(query: str) -> Dict[str, Any]:
+    """Query string -> job options (JOB_DEFAULTS + validated overrides). Fonts are server-side only."""
+    opts = dict(JOB_DEFAULTS)
+    for key, values in parse_qs(query, keep_blank_values=True).items():
+        v = values[-1]
+        if key == "annotate":
+            # annotate=1 -> default block boxes; annotate=<regex> -> boxes around matches
+            if _parse_bool(v):
+                opts["annotate"] = {"mode": "all_text_blocks", "regex_pattern": ""}
+            elif v.strip().lower() in ("", "0", "false", "no", "off"):
+                opts["annotate"] = None
+            else:
+                opts["annotate"] = {"mode": "regex", "regex_pattern": v}
+            continue
+        typ = _PARAM_TYPES.get(key)
+        if typ is None:
+            raise ApiError(400, f"Unknown option: {key}")
+        try:
+            opts[key] = _parse_bool(v) if typ is bool else typ(v)
+        except ValueError:
+            raise ApiError(400, f"Invalid value for {key}: {v!r}")
+        if key in _CHOICES and opts[key] not in _CHOICES[key]:
+            raise ApiError(400, f"{key} must be one of {list(_CHOICES[key])}")
+    if opts["mode"] == "overlay" and not opts["auto_overlay"]:
+        raise ApiError(400, "Overlay mode needs auto_overlay=1 (JSON items are not accepted here).")
+    return opts
+
+def public_status(st: Dict[str, Any]) -> Dict[str, Any]:
+    """Status as returned to clients: no server paths, result files by name."""
+    out = {k: st[k] for k in ("job_id", "state", "stage", "progress", "filename", "queue_position",
+                              "timings", "warning", "error", "cached") if k in st}
+    if "submitted" in st:
+        end = st.get("finished") or time.time()
+        out["elapsed_s"] = round(end - st["submitted"], 3)
+    res = st.get("result")
+    if st.get("state") == "done" and res:
+        out["timings"] = res.get("timings", out.get("timings"))
+        if res.get("annotate_timings"):
+            out["annotate_timings"] = res["annotate_timings"]
+        out["result"] = {
+            "zip": res["zip_name"],
+            "zip_bytes": res.get("zip_bytes"),
+            "files": [os.path.basename(p) for p in res["pdfs"]],
+            "url": f"/jobs/{st['job_id']}/result",
+        }
+    return out
+
+# ------------------ HTTP ------------------
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "PDFTranslateAPI/1.0"
+    jobs: JobManager = None  # set by make_server
+
+    def log_message(self, fmt, *args):
+        print(f"[api] {self.address_string()} " + (fmt % args))
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self) -> Tuple[Optional[str], Optional[str], str]:
+        parts = urlsplit(self.path)
+        seg = [s for s in parts.path.split("/") if s]
+        if not seg or seg[0] != "jobs":
+            return (seg[0] if seg else None), None, parts.query
+        job_id = seg[1] if len(seg) > 1 else None
+        action = seg[2] if len(seg) > 2 else None
+        return "jobs", (job_id if action is None else f"{job_id}/{action}"), parts.query
+
+    def _dispatch(self, handler) -> None:
+        try:
+            handler()
+        except ApiError as e:
+            self._send_json(e.status, {"error": str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    # ---- POST /jobs ----
+    def do_POST(self):
+        self._dispatch(self._post)
+
+    def _post(self):
+        root, rest, query = self._route()
+        if root != "jobs" or rest is not None:
+            raise ApiError(404, "Not found")
+        length = self.headers.get("Content-Length")
+        if length is None:
+            raise ApiError(411, "Content-Length required")
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length <= 0:  # a negative length would make rfile.read() read to EOF, past the size limit
+            self.close_connection = True
+            raise ApiError(400, "Content-Length must be a positive integer")
+        if length > MAX_UPLOAD_MB * 1024 * 1024:
+            self.close_connection = True
+            raise ApiError(413, f"Upload exceeds {MAX_UPLOAD_MB:g} MB")
+        opts = parse_job_options(query)
+        if self.jobs.pending() >= MAX_PENDING_JOBS:
+            self.close_connection = True
+            raise ApiError(429, "Too many pending jobs, retry later")
+        data = self.rfile.read(length)
+        if len(data) != length:
+            self.close_connection = True
+            raise ApiError(400, "Body shorter than Content-Length")
+        if not data.startswith(b"%PDF"):
+            raise ApiError(415, "Body is not a PDF")
+        filename = self.headers.get("X-Filename", "input.pdf")
+        job_id = self.jobs.submit(data, opts, filename=filename)
+        self._send_json(202, {"job_id": job_id, "status_url": f"/jobs/{job_id}",
+                              "result_url": f"/jobs/{job_id}/result"})
+
+    # ---- GET ----
+    def do_GET(self):
+        self._dispatch(self._get)
+
+    def _get(self):
+        root, rest, query = self._route()
+        if root == "health":
+            return self._send_json(200, {"ok": True, "workers": self.jobs.max_workers,
+                                         "pending": self.jobs.pending(), "warm": self.jobs.worker_stats()})
+        if root != "jobs" or not rest:
+            raise ApiError(404, "Not found")
+        job_id, _, action = rest.partition("/")
+        st = self.jobs.status(job_id)
+        if st.get("state") == "unknown":
+            raise ApiError(404, f"Unknown job: {job_id}")
+        if not action:
+            return self._send_json(200, public_status(st))
+        if action != "result":
+            raise ApiError(404, "Not found")
+        if st["state"] != "done":
+            raise ApiError(409, f"Job is {st['state']}")
+        res = st["result"]
+        wanted = parse_qs(query).get("file", [None])[-1]
+        if wanted is None:
+            return self._stream_file(res["zip"], "application/zip")
+        by_name = {os.path.basename(p): p for p in res["pdfs"]}
+        if wanted not in by_name:
+            raise ApiError(404, f"No such result file: {wanted}")
+        self._stream_file(by_name[wanted], "application/pdf")
+
+    def _stream_file(self, path: str, ctype: str) -> None:
+        size = os.path.getsize(path)
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(size))
+        self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+        self.end_headers()
+        with open(path, "rb") as f:
+            while True:
+                buf = f.read(CHUNK)
+                if not buf: break
+                self.wfile.write(buf)
+
+    # ---- DELETE /jobs/<id> ----
+    def do_DELETE(self):
+        self._dispatch(self._delete)
+
+    def _delete(self):
+        root, rest, _ = self._route()
+        if root != "jobs" or not rest or "/" in rest:
+            raise ApiError(404, "Not found")
+        if self.jobs.status(rest).get("state") == "unknown":
+            raise ApiError(404, f"Unknown job: {rest}")
+        self._send_json(200, {"job_id": rest, "cancelled": self.jobs.cancel(rest)})
+
+def make_server(host: str = "127.0.0.1", port: int = 8080,
+                jobs: Optional[JobManager] = None) -> ThreadingHTTPServer:
+    handler = type("BoundApiHandler", (ApiHandler,), {"jobs": jobs or JobManager()})
+    return ThreadingHTTPServer((host, port), handler)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="HTTP API for PDF translation jobs.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--workers", type=int, default=DEFAULT_JOB_WORKERS,
+                    help="Translation worker processes (bounded pool)")
+    args = ap.parse_args(argv)
+
+    jobs = JobManager(max_workers=args.workers)
+    httpd = make_server(args.host, args.port, jobs)
+    print(f"[api] listening on http://{args.host}:{args.port} with {jobs.max_workers} worker(s)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close(); jobs.shutdown()
+
+if __name__ == "__main__":
+    main()
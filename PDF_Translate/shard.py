@@ -0,0 +1,240 @@
+from typing import List, Tuple, Dict, Any, Optional
+import fitz, os, json, socket, time
+
+from .utils import save_pdf, write_zip, stitched_garbage
+
+# Labels produced by run_mode(mode="all"); overlay only when items were available.
+ALL_LABELS = ("span", "line", "block", "hybrid", "overlay")
+
+# A claim whose owner cannot be checked (another host) is taken over after this long.
+SHARD_LOCK_TIMEOUT_S = float(os.environ.get("PDF_TRANSLATE_SHARD_LOCK_TIMEOUT_S", str(6 * 3600)))
+
+# ------------------ page selection ------------------
+def parse_page_spec(spec: str, n_pages: int) -> List[int]:
+    """
+    '1-3,7,10-' -> sorted 0-based page indices. Page numbers are 1-based and
+    clipped to the document; an open end ('10-') runs to the last page.
+    """
+    pages = set()
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part: continue
+        if "-" in part:
+            a, b = part.split("-", 1)
+            start = int(a) if a.strip() else 1
+            end = int(b) if b.strip() else n_pages
+        else:
+            start = end = int(part)
+        if start > end: start, end = end, start
+        for p in range(max(1, start), min(n_pages, end) + 1):
+            pages.add(p - 1)
+    if not pages:
+        raise ValueError(f"Page selection '{spec}' matches no pages (document has {n_pages}).")
+    return sorted(pages)
+
+def write_page_subset(input_pdf: str, pages: List[int], out_pdf: str) -> str:
+    """Copy the given 0-based pages of input_pdf (in order) into out_pdf."""
+    src = fitz.open(input_pdf); out = fitz.open()
+    try:
+        for pno in pages:
+            out.insert_pdf(src, from_page=pno, to_page=pno)
+        os.makedirs(os.path.dirname(out_pdf) or ".", exist_ok=True)
+        out.save(out_pdf)
+    finally:
+        out.close(); src.close()
+    return out_pdf
+
+def plan_shards(pages: List[int], shard_size: int) -> List[List[int]]:
+    """Split the selected pages into consecutive chunks of at most shard_size pages."""
+    shard_size = max(1, int(shard_size))
+    return [pages[i:i + shard_size] for i in range(0, len(pages), shard_size)]
+
+# ------------------ manifest ------------------
+def _shard_stem(base: str, idx: int) -> str:
+    return f"{base}.shard-{idx:04d}"
+
+def shard_output_pdf(manifest: Dict[str, Any], idx: int) -> str:
+    base, ext = os.path.splitext(manifest["output"])
+    return f"{_shard_stem(base, idx)}{ext}"
+
+def shard_partial_outputs(manifest: Dict[str, Any], idx: int) -> Dict[str, str]:
+    """label -> partial PDF path a shard is expected to write (same naming as run_mode)."""
+    out_pdf = shard_output_pdf(manifest, idx)
+    if manifest["mode"] != "all":
+        return {manifest["mode"]: out_pdf}
+    base, ext = os.path.splitext(out_pdf)
+    return {label: f"{base}.{label}{ext}" for label in ALL_LABELS}
+
+def manifest_path_for(output_pdf: str) -> str:
+    base, _ = os.path.splitext(output_pdf)
+    return f"{base}.shards.json"
+
+def create_or_load_manifest(input_pdf: str, output_pdf: str, mode: str,
+                            pages: List[int], shard_size: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    Create the shard manifest next to output_pdf, or load it if another worker
+    already did. Creation is atomic (O_EXCL), so concurrent workers agree on one plan.
+    """
+    path = manifest_path_for(output_pdf)
+    manifest = {
+        "input": os.path.abspath(input_pdf),
+        "output": os.path.abspath(output_pdf),
+        "mode": mode,
+        "shard_size": int(shard_size),
+        "shards": [{"index": i, "pages": chunk}
+                   for i, chunk in enumerate(plan_shards(pages, shard_size))],
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        existing = load_manifest(path)
+        if existing["input"] != manifest["input"] or existing["mode"] != mode:
+            raise ValueError(f"Manifest {path} belongs to a different input/mode; remove it to re-plan.")
+        if (existing.get("shard_size") != manifest["shard_size"]
+                or [sh["pages"] for sh in existing["shards"]] != [sh["pages"] for sh in manifest["shards"]]):
+            raise ValueError(f"Manifest {path} was planned with a different --pages/--shard-size; "
+                             f"use the same options or remove it to re-plan.")
+        return path, existing
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return path, manifest
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    # A worker may see the file between O_EXCL create and the first write.
+    for _ in range(50):
+        with open(path, "r", encoding="utf-8") as f:
+            data = f.read()
+        if data.strip():
+            return json.loads(data)
+        time.sleep(0.1)
+    raise ValueError(f"Manifest {path} is empty.")
+
+# ------------------ file-based work queue ------------------
+def _lock_path(manifest: Dict[str, Any], idx: int) -> str:
+    return shard_output_pdf(manifest, idx) + ".lock"
+
+def _done_path(manifest: Dict[str, Any], idx: int) -> str:
+    return shard_output_pdf(manifest, idx) + ".done.json"
+
+def shard_is_done(manifest: Dict[str, Any], idx: int) -> bool:
+    return os.path.exists(_done_path(manifest, idx))
+
+def _lock_is_stale(lock: str, timeout_s: float) -> bool:
+    """
+    A lock is stale when its owner ('host:pid') is a dead process on this host,
+    or, for owners elsewhere, when it is older than timeout_s.
+    """
+    try:
+        with open(lock, "r", encoding="utf-8") as f:
+            host, _, pid = f.read().strip().rpartition(":")
+        age = time.time() - os.path.getmtime(lock)
+    except OSError:
+        return False
+    if host == socket.gethostname() and pid.isdigit():
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass  # alive, owned by another user
+        else:
+            return False
+    return age > timeout_s
+
+def _break_stale_lock(lock: str, timeout_s: float) -> bool:
+    """Remove a stale lock; the atomic rename lets only one of several racing workers win."""
+    if not _lock_is_stale(lock, timeout_s):
+        return False
+    grave = f"{lock}.stale-{socket.gethostname()}-{os.getpid()}"
+    try:
+        os.rename(lock, grave)
+    except OSError:
+        return False
+    os.remove(grave)
+    print(f"[shard] reclaimed stale lock {lock}")
+    return True
+
+def claim_next_shard(manifest: Dict[str, Any], only: Optional[int] = None,
+                     lock_timeout_s: float = SHARD_LOCK_TIMEOUT_S) -> Optional[int]:
+    """
+    Claim the next unprocessed shard by atomically creating its lock file.
+    Any number of processes (or nodes on a shared filesystem) can call this.
+    Locks left by crashed workers are reclaimed (see _lock_is_stale).
+    """
+    for sh in manifest["shards"]:
+        idx = sh["index"]
+        if only is not None and idx != only:
+            continue
+        if shard_is_done(manifest, idx):
+            continue
+        lock = _lock_path(manifest, idx)
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not _break_stale_lock(lock, lock_timeout_s):
+                continue
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(f"{socket.gethostname()}:{os.getpid()}\n")
+        return idx
+    return None
+
+def release_shard(manifest: Dict[str, Any], idx: int) -> None:
+    """Drop a claim without marking it done (e.g. after a failure) so another worker can retry."""
+    try:
+        os.remove(_lock_path(manifest, idx))
+    except FileNotFoundError:
+        pass
+
+def mark_shard_done(manifest: Dict[str, Any], idx: int, seconds: float) -> None:
+    outputs = {label: p for label, p in shard_partial_outputs(manifest, idx).items() if os.path.exists(p)}
+    with open(_done_path(manifest, idx), "w", encoding="utf-8") as f:
+        json.dump({"index": idx, "host": socket.gethostname(), "pid": os.getpid(),
+                   "seconds": round(seconds, 3), "outputs": outputs}, f, indent=2)
+    release_shard(manifest, idx)
+
+# ------------------ merge ------------------
+def merge_shards(manifest_path: str, output_pdf: Optional[str] = None,
+                 save_profile: str = "fast") -> List[str]:
+    """
+    Stitch per-shard partial PDFs into the final output(s), in page order.
+    For mode 'all' this writes one PDF per label plus the '<base>_all_methods.zip'
+    bundle that run_mode would have produced for an unsharded run.
+    """
+    manifest = load_manifest(manifest_path)
+    missing = [sh["index"] for sh in manifest["shards"] if not shard_is_done(manifest, sh["index"])]
+    if missing:
+        raise ValueError(f"Cannot merge: shards not finished: {missing}")
+
+    final_pdf = output_pdf or manifest["output"]
+    base, ext = os.path.splitext(final_pdf)
+    labels = ALL_LABELS if manifest["mode"] == "all" else (manifest["mode"],)
+
+    written: List[Tuple[str, str]] = []
+    for label in labels:
+        parts = [shard_partial_outputs(manifest, sh["index"])[label] for sh in manifest["shards"]]
+        parts = [p for p in parts if os.path.exists(p)]
+        if not parts:
+            continue
+        if len(parts) != len(manifest["shards"]):
+            print(f"[WARN] {label}: only {len(parts)}/{len(manifest['shards'])} shards produced output; skipping.")
+            continue
+        target = f"{base}.{label}{ext}" if manifest["mode"] == "all" else final_pdf
+        merged = fitz.open()
+        for p in parts:
+            with fitz.open(p) as part:
+                merged.insert_pdf(part)
+        # each shard embeds its own font copies; merge identical streams
+        save_pdf(merged, target, save_profile, stitched_garbage(save_profile)); merged.close()
+        written.append((label, target))
+        print(f"[OK] Merged {len(parts)} shards -> {target}")
+
+    if manifest["mode"] == "all":
+        zip_path = f"{base}_all_methods.zip"
+        write_zip(zip_path, [(path, os.path.basename(path)) for _, path in written])
+        print(f"[OK] Zipped {len(written)} merged PDFs -> {zip_path}")
+    return [p for _, p in written]
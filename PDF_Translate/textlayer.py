@@ -1,27 +1,279 @@
-from typing import Tuple, List, Dict, Any
-import statistics, asyncio, nest_asyncio, fitz, re
+from typing import Tuple, List, Dict, Any, Optional, Sequence
+from collections import OrderedDict
+import statistics, fitz, re, os
 
-nest_asyncio.apply()
+from .utils import normalize_color, Span, Line, Block, rect_iou, rect_center, point_in_rect, center_dist, open_pdf, PdfSource, _FIT_COUNTS
+from .constants import translator
+from .glossary import active_glossary
 
-from .utils import normalize_color, Span, Line, Block, rect_iou, rect_center, point_in_rect, center_dist
-from .constants import _TR
+# ------------------ pass-through filter ------------------
+# A unit goes to the translator only if, outside links and e-mail addresses, it
+# has a letter that is not already in the target script. Numbers, dates, page
+# numbers, punctuation, URLs and target-script text come back unchanged.
+# One possessive fullmatch per unit, no findall; links are only tried at the
+# start of a whitespace-separated token, which keeps the scan linear.
+_LINK = r"(?i:https?://|www\.)\S+|[\w.+-]+@[\w-]+(?:\.[\w-]+)+"
 
-def translate_text(text: str, src: str, dest: str) -> str:
+def _pass_through_rx(source_letters: str) -> "re.Pattern[str]":
+    tok = rf"(?:(?:{_LINK})(?=\s|$)|[^{source_letters}\s]++)"
+    return re.compile(rf"\s*+(?:{tok}(?:\s++{tok})*+)?\s*+")
+
+_PASS_THROUGH = {
+    "hi": _pass_through_rx("A-Za-z"),          # -> Hindi: no Latin letters
+    "en": _pass_through_rx("\u0900-\u097F"),   # -> English: no Devanagari
+}
+_UNIT_COUNTS = {"units": 0, "passed": 0, "tm_exact": 0, "tm_template": 0, "calls": 0, "glossary": 0,
+                "repeat_hits": 0, "repeat_calls": 0}
+
+def is_pass_through(text: str, dest: str) -> bool:
+    rx = _PASS_THROUGH.get(dest)
+    return rx is not None and rx.fullmatch(text) is not None
+
+def unit_counts(reset: bool = False) -> Dict[str, int]:
+    """
+    Counters of translate_text in this process: units seen, passed through,
+    translation-memory hits (exact / via placeholders), translator calls,
+    units with glossary terms, recurring units answered by a RepeatMemo (with
+    the translator calls that actually avoided) and font-size searches skipped
+    through its fit memo.
+    """
+    out = dict(_UNIT_COUNTS, **_FIT_COUNTS)
+    if reset:
+        for k in _UNIT_COUNTS: _UNIT_COUNTS[k] = 0
+        for k in _FIT_COUNTS: _FIT_COUNTS[k] = 0
+    return out
+
+# ------------------ translation memory ------------------
+# Process-wide, LRU-bounded. Before the lookup, numbers, dates and IDs (any
+# token with a digit) and, from Hindi, Latin tokens are swapped for {0}, {1}, ...
+# so "कुल राशि 1,234" and "कुल राशि 5,678" share one translator call. A template
+# is only stored when its translation kept every placeholder exactly once;
+# otherwise it is marked and those segments are translated (and cached) verbatim.
+# Glossary terms (see glossary.py) become placeholders in the same pass and are
+# restored as their fixed target forms; when placeholders do not survive, only the
+# text between the terms is translated and the target forms are spliced back in.
+TM_MAX_ENTRIES = int(os.environ.get("PDF_TRANSLATE_TM_SIZE", "50000"))  # 0 disables
+_TOKEN_EDGE = r"(?<![^\s\u0900-\u097F])"  # tokens start after whitespace/Devanagari
+_NUMERIC = r"[^\s\u0900-\u097F]*[0-9\u0966-\u096F][^\s\u0900-\u097F]*"
+_BRACED = r"[^\s\u0900-\u097F]*[{}][^\s\u0900-\u097F]*"  # kept verbatim so braces never look like placeholders
+_MASK = {
+    "hi": re.compile(rf"{_TOKEN_EDGE}(?:{_NUMERIC}|{_BRACED}|[A-Za-z][^\s\u0900-\u097F]*)"),
+    "en": re.compile(rf"{_TOKEN_EDGE}(?:{_NUMERIC}|{_BRACED})"),
+}
+_PLACEHOLDER = re.compile(r"\{(\d+)\}")
+_TM: "OrderedDict[Tuple[str, str, str, str], str]" = OrderedDict()  # (src, dest, text|template, glossary)
+_TM_BROKEN: set = set()
+
+def mask_tokens(text: str, src: str,
+                terms: Sequence[Tuple[int, int, str]] = ()) -> Tuple[str, List[str]]:
+    """
+    text -> (template with {i} placeholders, restore values): glossary terms
+    (Glossary.find spans, restored as their target form), then numbers/IDs/Latin
+    tokens and any token with a brace in the gaps between them.
+    """
+    rx = _MASK.get(src)
+    tokens: List[str] = []
+    def _sub(m):
+        tokens.append(m.group(0)); return f"{{{len(tokens) - 1}}}"
+    if not terms:
+        return (rx.sub(_sub, text) if rx else text), tokens
+    pieces: List[str] = []; pos = 0
+    for a, b, target in list(terms) + [(len(text), len(text), None)]:
+        gap = text[pos:a]
+        pieces.append(rx.sub(_sub, gap) if rx else gap)
+        if target is not None:
+            tokens.append(target); pieces.append(f"{{{len(tokens) - 1}}}")
+        pos = b
+    return "".join(pieces), tokens
+
+def unmask_tokens(template_out: str, tokens: List[str]) -> Optional[str]:
+    """Put tokens back; None unless every placeholder occurs exactly once."""
+    found = _PLACEHOLDER.findall(template_out)
+    if sorted(found) != sorted(str(i) for i in range(len(tokens))):
+        return None
+    return _PLACEHOLDER.sub(lambda m: tokens[int(m.group(1))], template_out)
+
+def _tm_get(key: Tuple[str, str, str, str]) -> Optional[str]:
+    out = _TM.get(key)
+    if out is not None: _TM.move_to_end(key)
+    return out
+
+def _tm_put(key: Tuple[str, str, str, str], value: str) -> None:
+    if TM_MAX_ENTRIES <= 0: return
+    _TM[key] = value
+    if len(_TM) > TM_MAX_ENTRIES: _TM.popitem(last=False)
+
+_NESTED_LOOP = False
+
+def _resolve(res):
+    """googletrans 4 returns coroutines; run them to completion, also from inside a live loop (Streamlit, Jupyter)."""
+    global _NESTED_LOOP
+    import asyncio
+    if not asyncio.iscoroutine(res): return res
+    if not _NESTED_LOOP:
+        import nest_asyncio
+        nest_asyncio.apply(); _NESTED_LOOP = True
+    return asyncio.get_event_loop().run_until_complete(res)
+
+def count_repeat_hit(first_calls: int, copies: int = 1) -> None:
+    """Recurring units answered by RepeatMemo; their first copy cost first_calls translator calls."""
+    _UNIT_COUNTS["repeat_hits"] += copies
+    # with the memory on, translate_text would have been an exact hit: no call avoided
+    if TM_MAX_ENTRIES <= 0: _UNIT_COUNTS["repeat_calls"] += copies * first_calls
+
+def _translate_raw(text: str, src: str, dest: str) -> Optional[str]:
+    """One translator call; None on failure (nothing is cached then)."""
+    _UNIT_COUNTS["calls"] += 1
     try:
-        res = _TR.translate(text, src=src, dest=dest)
-        if asyncio.iscoroutine(res):
-            loop = asyncio.get_event_loop(); res = loop.run_until_complete(res)
+        res = _resolve(translator().translate(text, src=src, dest=dest))
         out = getattr(res, "text", text)
         # normalize whitespace and avoid spaces before punctuation/danda
         out = "\n".join(" ".join(line.split()) for line in out.splitlines())
         out = re.sub(r"\s+([,.;:!?\u0964])", r"\1", out)
         return out
     except Exception as e:
-        print(f"[translate] {type(e).__name__}: {e}"); return text
+        print(f"[translate] {type(e).__name__}: {e}"); return None
+
+def _translate_around_terms(text: str, terms: Sequence[Tuple[int, int, str]],
+                            src: str, dest: str) -> Optional[str]:
+    """
+    Glossary fallback without placeholders: translate only the text between the
+    terms ('\n'-joined, one call; per gap if the line count changes) and splice
+    the target forms back in. None if the translator failed.
+    """
+    gaps: List[str] = []; pos = 0
+    for a, b, _ in terms:
+        gaps.append(text[pos:a]); pos = b
+    gaps.append(text[pos:])
+    todo = [i for i, g in enumerate(gaps) if g.strip() and not is_pass_through(g.strip(), dest)]
+    reqs = [gaps[i].strip() for i in todo]
+    outs: List[Optional[str]] = []
+    if reqs and not any("\n" in r for r in reqs):
+        res = _translate_raw("\n".join(reqs), src, dest)
+        if res is None: return None
+        outs = res.split("\n")
+    if len(outs) != len(reqs):
+        outs = [_translate_raw(r, src, dest) for r in reqs]
+        if any(o is None for o in outs): return None
+    for i, o in zip(todo, outs):
+        g = gaps[i]  # keep the gap's own leading/trailing whitespace around the terms
+        gaps[i] = g[:len(g) - len(g.lstrip())] + o + g[len(g.rstrip()):]
+    pieces = [gaps[0]]
+    for (_, _, target), gap in zip(terms, gaps[1:]):
+        pieces += [target, gap]
+    return "".join(pieces)
+
+def _enforced(terms, out: Optional[str]) -> Optional[str]:
+    """Count a unit for the [glossary] report once its terms made it into the output."""
+    if terms and out is not None: _UNIT_COUNTS["glossary"] += 1
+    return out
+
+def _prepare(text: str, src: str, dest: str):
+    """
+    Resolve text without a fresh request where possible: (result, None), else
+    (None, (request, tokens, tm_key, terms)) for the one call it still needs.
+    """
+    _UNIT_COUNTS["units"] += 1
+    if is_pass_through(text, dest):
+        _UNIT_COUNTS["passed"] += 1; return text, None
+
+    glossary = active_glossary()
+    gid = glossary.digest if glossary is not None else ""
+    exact = (src, dest, text, gid)
+    out = _tm_get(exact)
+    if out is not None:
+        _UNIT_COUNTS["tm_exact"] += 1; return out, None
+
+    terms = glossary.find(text) if glossary is not None else []
+    template, tokens = mask_tokens(text, src, terms)
+    tkey = (src, dest, template, gid)
+    if tokens and is_pass_through(template, dest):
+        # nothing left to translate (e.g. a cell that is just a glossary term or an ID)
+        _UNIT_COUNTS["passed"] += 1
+        return _enforced(terms, unmask_tokens(template, tokens)), None
+    if tokens and tkey not in _TM_BROKEN:
+        cached = _tm_get(tkey)
+        if cached is not None:
+            _UNIT_COUNTS["tm_template"] += 1
+            return _enforced(terms, unmask_tokens(cached, tokens)), None
+        return None, (template, tokens, tkey, terms)
+    if terms:  # this template is known to lose its placeholders
+        out = _enforced(terms, _translate_around_terms(text, terms, src, dest))
+        if out is None: return text, None
+        _tm_put(exact, out); return out, None
+    return None, (text, [], exact, terms)
+
+def _finish(text: str, src: str, dest: str, pending, t_out: Optional[str]) -> str:
+    """Cache and restore the translator's answer to a _prepare request."""
+    if t_out is None: return text  # translator unavailable; don't pay for a second call
+    _, tokens, key, terms = pending
+    if not tokens:
+        _tm_put(key, t_out); return t_out
+    restored = unmask_tokens(t_out, tokens)
+    if restored is not None:
+        _tm_put(key, t_out); return _enforced(terms, restored)
+    _TM_BROKEN.add(key)
+    if terms:
+        out = _enforced(terms, _translate_around_terms(text, terms, src, dest))
+    else:
+        out = _translate_raw(text, src, dest)
+    if out is None: return text
+    _tm_put((src, dest, text, key[3]), out)
+    return out
+
+def translate_text(text: str, src: str, dest: str) -> str:
+    out, pending = _prepare(text, src, dest)
+    if pending is None: return out
+    return _finish(text, src, dest, pending, _translate_raw(pending[0], src, dest))
+
+BATCH_MAX_CHARS = 4500  # per joined request; the web endpoint rejects ~5000+
+
+def translate_batch(texts: Sequence[str], src: str, dest: str,
+                    max_chars: int = BATCH_MAX_CHARS) -> List[str]:
+    """
+    translate_text for many short units (table cells) at once. Units are
+    deduplicated, resolved through the filter and memory, and the remaining
+    requests go out '\n'-joined, as few calls as max_chars allows. A call whose
+    answer comes back with a different line count is retried unit by unit.
+    """
+    done: Dict[str, str] = {}
+    waiting: Dict[Tuple[str, str, str, str], List[Tuple[str, Any]]] = {}  # tm key -> units sharing that request
+    for text in texts:
+        if text in done: continue
+        out, pending = _prepare(text, src, dest)
+        if pending is None:
+            done[text] = out; continue
+        group = waiting.setdefault(pending[2], [])
+        if group: _UNIT_COUNTS["tm_template" if pending[1] else "tm_exact"] += 1
+        group.append((text, pending))
+        done[text] = text  # placeholder until answered; also dedups later repeats
+
+    chunks: List[List[Tuple[str, str, str, str]]] = []
+    size = max_chars
+    for key in waiting:
+        req = waiting[key][0][1][0]
+        if "\n" in req or size + len(req) + 1 > max_chars:
+            chunks.append([]); size = 0
+        chunks[-1].append(key)
+        size = max_chars if "\n" in req else size + len(req) + 1  # multi-line units go alone
+
+    for chunk in chunks:
+        reqs = [waiting[k][0][1][0] for k in chunk]
+        res = _translate_raw("\n".join(reqs), src, dest)
+        if res is None or len(chunk) == 1:
+            parts = [res] * len(chunk)
+        else:
+            parts = res.split("\n")
+            if len(parts) != len(chunk):  # lines merged/split; go one by one
+                parts = [_translate_raw(r, src, dest) for r in reqs]
+        for k, t_out in zip(chunk, parts):
+            for text, pending in waiting[k]:
+                done[text] = _finish(text, src, dest, pending, t_out)
+    return [done[t] for t in texts]
 
 # ------------------ original style extraction ------------------
-def extract_original_page_objects(input_pdf: str) -> Dict[int, List[Dict[str, Any]]]:
-    doc = fitz.open(input_pdf); per_page: Dict[int, List[Dict[str, Any]]] = {}
+def extract_original_page_objects(input_pdf: PdfSource) -> Dict[int, List[Dict[str, Any]]]:
+    doc = open_pdf(input_pdf); per_page: Dict[int, List[Dict[str, Any]]] = {}
     for page_num, page in enumerate(doc):
         arr = per_page.setdefault(page_num, [])
         for block in page.get_text("dict")["blocks"]:
@@ -60,71 +312,93 @@ def transfer_color_size_from_original(spans: List[Span],
         nearest = min(candidates, key=lambda c: center_dist(sp.rect, c["bbox"]))
         sp.color = nearest["color"]; sp.fontsize = nearest["size"]
 
+_PRES_FLAGS = fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_PRESERVE_LIGATURES
+
 def _rawdict(page: fitz.Page):
     try:
-        PRES = fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_PRESERVE_LIGATURES
-        return page.get_textpage(flags=PRES).extractRAWDICT()
+        return page.get_textpage(flags=_PRES_FLAGS).extractRAWDICT()
     except Exception:
         return page.get_text("rawdict")
 
-def extract_spans_from_textlayer(doc: fitz.Document) -> List[Span]:
+class PageText:
+    """
+    Span-level text of one page ('dict' output: no per-character dicts).
+    Char data is fetched lazily, from the same TextPage, only for a span that
+    comes back without text; normally that never happens.
+    """
+    def __init__(self, page: fitz.Page):
+        self.page = page
+        try:
+            self._tp = page.get_textpage(flags=_PRES_FLAGS)
+            self.dict = self._tp.extractDICT()
+        except Exception:
+            self._tp = None
+            self.dict = page.get_text("dict")
+        self._raw = None
+
+    def blocks(self) -> List[Dict[str, Any]]:
+        return self.dict.get("blocks", [])
+
+    def chars(self, bi: int, li: int, si: int) -> List[Dict[str, Any]]:
+        if self._raw is None:
+            self._raw = self._tp.extractRAWDICT() if self._tp is not None else _rawdict(self.page)
+        try:
+            return self._raw["blocks"][bi]["lines"][li]["spans"][si].get("chars") or []
+        except (IndexError, KeyError):
+            return []
+
+    def span_text_bbox(self, sp: Dict[str, Any], key: Tuple[int, int, int],
+                       fallback: Tuple[float, ...]) -> Tuple[str, Tuple[float, ...]]:
+        """(stripped text, bbox) of a span, same as joining its rawdict chars; chars only when text is missing."""
+        t = sp.get("text")
+        if isinstance(t, str):
+            return t.strip(), tuple(map(float, sp.get("bbox") or fallback))
+        chars = sp.get("chars") or self.chars(*key)
+        t = "".join(ch.get("c", "") for ch in chars).strip()
+        boxes = [c["bbox"] for c in chars if "bbox" in c]
+        if sp.get("bbox"):
+            bb = tuple(map(float, sp["bbox"]))
+        elif boxes:
+            bb = (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                  max(b[2] for b in boxes), max(b[3] for b in boxes))
+        else:
+            bb = tuple(map(float, fallback))
+        return t, bb
+
+def extract_spans_from_textlayer(doc: fitz.Document,
+                                 keys: Optional[List[Tuple[int, int, int]]] = None) -> List[Span]:
+    """keys: if given, gets the (page, block_no, line_no) of every returned span."""
     spans: List[Span] = []
     for pno in range(len(doc)):
-        raw = _rawdict(doc[pno])
-        for b in raw.get("blocks", []):
+        pt = PageText(doc[pno])
+        for bi, b in enumerate(pt.blocks()):
             if "lines" not in b: continue
             block_bbox = tuple(b.get("bbox", (0,0,0,0)))
-            for ln in b.get("lines", []):
-                for sp in ln.get("spans", []):
-                    # text
-                    if isinstance(sp.get("text"), str) and sp["text"].strip():
-                        t = " ".join(sp["text"].split())
-                    else:
-                        chars = sp.get("chars") or []
-                        t = "".join(ch.get("c","") for ch in chars).strip()
+            for li, ln in enumerate(b.get("lines", [])):
+                for si, sp in enumerate(ln.get("spans", [])):
+                    t, bb = pt.span_text_bbox(sp, (bi, li, si), block_bbox)
                     if not t: continue
-                    # bbox
-                    if sp.get("bbox"): bb = tuple(map(float, sp["bbox"]))
-                    else:
-                        chars = sp.get("chars") or []
-                        if chars:
-                            xs0=[c["bbox"][0] for c in chars if "bbox" in c]
-                            ys0=[c["bbox"][1] for c in chars if "bbox" in c]
-                            xs1=[c["bbox"][2] for c in chars if "bbox" in c]
-                            ys1=[c["bbox"][3] for c in chars if "bbox" in c]
-                            bb = (min(xs0),min(ys0),max(xs1),max(ys1)) if xs0 else tuple(map(float, block_bbox))
-                        else:
-                            bb = tuple(map(float, block_bbox))
                     size = float(sp.get("size", 11.5))
                     color = normalize_color(sp.get("color", (0,0,0)))
                     spans.append(Span(pno, (bb[0],bb[1],bb[2],bb[3]), t, size, color))
+                    if keys is not None: keys.append((pno, bi, li))
     return spans
 
-def extract_lines_from_textlayer(doc: fitz.Document) -> List[Line]:
+def extract_lines_from_textlayer(doc: fitz.Document,
+                                 keys: Optional[List[Tuple[int, int, int]]] = None) -> List[Line]:
+    """keys: if given, gets the (page, block_no, line_no) of every returned line."""
     lines: List[Line] = []
     for pno in range(len(doc)):
-        raw = _rawdict(doc[pno])
-        for b in raw.get("blocks", []):
+        pt = PageText(doc[pno])
+        for bi, b in enumerate(pt.blocks()):
             if "lines" not in b: continue
             block_bbox = tuple(b.get("bbox", (0,0,0,0)))
-            for ln in b.get("lines", []):
+            for li, ln in enumerate(b.get("lines", [])):
                 spans = ln.get("spans", [])
                 if not spans: continue
                 txts, rects, sizes = [], [], []
-                for sp in spans:
-                    if isinstance(sp.get("text"), str) and sp["text"].strip():
-                        t = " ".join(sp["text"].split()); bb = tuple(map(float, sp.get("bbox", block_bbox)))
-                    else:
-                        chars = sp.get("chars") or []
-                        t = "".join(ch.get("c","") for ch in chars).strip()
-                        if chars:
-                            xs0=[c["bbox"][0] for c in chars if "bbox" in c]
-                            ys0=[c["bbox"][1] for c in chars if "bbox" in c]
-                            xs1=[c["bbox"][2] for c in chars if "bbox" in c]
-                            ys1=[c["bbox"][3] for c in chars if "bbox" in c]
-                            bb = (min(xs0),min(ys0),max(xs1),max(ys1)) if xs0 else tuple(map(float, sp.get("bbox", block_bbox)))
-                        else:
-                            bb = tuple(map(float, sp.get("bbox", block_bbox)))
+                for si, sp in enumerate(spans):
+                    t, bb = pt.span_text_bbox(sp, (bi, li, si), block_bbox)
                     if t: txts.append(t)
                     rects.append(bb); sizes.append(float(sp.get("size", 11.5)))
                 line_text = " ".join(" ".join(txts).split())
@@ -133,33 +407,22 @@ def extract_lines_from_textlayer(doc: fitz.Document) -> List[Line]:
                 x1=max(r[2] for r in rects); y1=max(r[3] for r in rects)
                 avg_size = sum(sizes)/max(1, len(sizes))
                 lines.append(Line(pno, (x0,y0,x1,y1), line_text, avg_size, (0.0,)))
+                if keys is not None: keys.append((pno, bi, li))
     return lines
 
 def extract_blocks_from_textlayer(doc: fitz.Document) -> List[Block]:
     blocks: List[Block] = []
     for pno in range(len(doc)):
-        raw = _rawdict(doc[pno])
-        for b in raw.get("blocks", []):
+        pt = PageText(doc[pno])
+        for bi, b in enumerate(pt.blocks()):
             if "lines" not in b: continue
+            block_bbox = tuple(b.get("bbox", (0,0,0,0)))
             block_rects: List[Tuple[float,float,float,float]] = []
             block_text_lines: List[str] = []; sizes: List[float] = []
-            for ln in b.get("lines", []):
+            for li, ln in enumerate(b.get("lines", [])):
                 line_txts, line_rects, line_sizes = [], [], []
-                for sp in ln.get("spans", []):
-                    if isinstance(sp.get("text"), str) and sp["text"].strip():
-                        t = " ".join(sp["text"].split())
-                        bb = tuple(map(float, sp.get("bbox", b.get("bbox",(0,0,0,0)))))
-                    else:
-                        chars = sp.get("chars") or []
-                        t = "".join(ch.get("c","") for ch in chars).strip()
-                        if chars:
-                            xs0=[c["bbox"][0] for c in chars if "bbox" in c]
-                            ys0=[c["bbox"][1] for c in chars if "bbox" in c]
-                            xs1=[c["bbox"][2] for c in chars if "bbox" in c]
-                            ys1=[c["bbox"][3] for c in chars if "bbox" in c]
-                            bb = (min(xs0),min(ys0),max(xs1),max(ys1)) if xs0 else tuple(map(float, b.get("bbox",(0,0,0,0))))
-                        else:
-                            bb = tuple(map(float, b.get("bbox",(0,0,0,0))))
+                for si, sp in enumerate(ln.get("spans", [])):
+                    t, bb = pt.span_text_bbox(sp, (bi, li, si), block_bbox)
                     if t: line_txts.append(t)
                     line_rects.append(bb); line_sizes.append(float(sp.get("size",11.5)))
                 if line_txts: block_text_lines.append(" ".join(line_txts))
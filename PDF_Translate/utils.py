@@ -1,12 +1,13 @@
 from dataclasses import dataclass
-from typing import Any, Tuple, List, Optional
-import fitz, os
+from typing import Any, Tuple, List, Optional, Dict, Union, Iterable
+import fitz, os, bisect, heapq, shutil, subprocess, time, zipfile, zlib
 from pathlib import Path
 
 from .constants import _LAT, _DEV
 
 # ------------------ dataclasses ------------------
-@dataclass
+# slots=True: no per-instance __dict__; OCR-dense documents create 10^5+ of these.
+@dataclass(slots=True)
 class Span:
     page: int
     rect: Tuple[float, float, float, float]
@@ -14,7 +15,7 @@ class Span:
     fontsize: float
     color: Tuple[float, ...]
 
-@dataclass
+@dataclass(slots=True)
 class Line:
     page: int
     rect: Tuple[float, float, float, float]
@@ -22,7 +23,7 @@ class Line:
     fontsize: float
     color: Tuple[float, ...]
 
-@dataclass
+@dataclass(slots=True)
 class Block:
     page: int
     rect: Tuple[float, float, float, float]
@@ -30,11 +31,18 @@ class Block:
     fontsize: float
     color: Tuple[float, ...]
 
+# Interned color tuples: a page usually has a handful of distinct colors, so
+# every unit with the same sRGB int shares one tuple instead of allocating its own.
+_INT_COLORS: Dict[int, Tuple[float, ...]] = {}
+
 def normalize_color(c: Any) -> Tuple[float, ...]:
     if c is None: return (0.0,)
     if isinstance(c, int):
-        r = (c >> 16) & 255; g = (c >> 8) & 255; b = c & 255
-        return (r/255.0, g/255.0, b/255.0)
+        rgb = _INT_COLORS.get(c)
+        if rgb is None:
+            r = (c >> 16) & 255; g = (c >> 8) & 255; b = c & 255
+            rgb = _INT_COLORS.setdefault(c, (r/255.0, g/255.0, b/255.0))
+        return rgb
     if isinstance(c, str):
         s = c.strip().lstrip("#")
         if len(s) == 6:
@@ -98,12 +106,151 @@ def _dominant_script(text: str) -> str:
     if lat > dev: return "en"
     return "auto"
 
-def build_base(src_pdf: str) -> Tuple[fitz.Document, fitz.Document]:
-    src = fitz.open(src_pdf); out = fitz.open()
-    for p in range(len(src)):
-        po = out.new_page(width=src[p].rect.width, height=src[p].rect.height)
-        po.show_pdf_page(po.rect, src, p)
-    return src, out
+BASE_STRATEGIES = ("copy", "xobject")
+
+def base_from_doc(src: fitz.Document, strategy: str = "copy") -> fitz.Document:
+    """
+    Output document carrying src's pages as background.
+      - copy:    duplicate the page objects (insert_pdf); cheapest, no wrapper objects
+      - xobject: wrap every source page in a Form XObject via show_pdf_page (legacy)
+    """
+    out = fitz.open()
+    if strategy == "copy":
+        out.insert_pdf(src)
+    elif strategy == "xobject":
+        for p in range(len(src)):
+            po = out.new_page(width=src[p].rect.width, height=src[p].rect.height)
+            po.show_pdf_page(po.rect, src, p)
+    else:
+        raise ValueError(f"Unknown base strategy: {strategy}")
+    return out
+
+# A PDF given either as a file path or as its bytes (e.g. an upload kept in memory).
+PdfSource = Union[str, bytes]
+
+def open_pdf(source: PdfSource) -> fitz.Document:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=bytes(source), filetype="pdf")
+    return fitz.open(source)
+
+def build_base(src_pdf: PdfSource, pages: Optional[List[int]] = None,
+               strategy: str = "copy") -> Tuple[fitz.Document, fitz.Document]:
+    """Open src_pdf (optionally reduced to the given 0-based pages) and an output copy of its background."""
+    src = open_pdf(src_pdf)
+    if pages is not None: src.select(pages)
+    return src, base_from_doc(src, strategy)
+
+def reopenable_source(doc: fitz.Document) -> PdfSource:
+    """What to hand to open_pdf for a fresh copy of doc: its file if it has one, else its bytes."""
+    name = getattr(doc, "name", None)
+    return name if name and os.path.exists(name) else doc.tobytes()
+
+def same_pdf_file(a: PdfSource, b: PdfSource) -> bool:
+    """True if both paths point at the same file (e.g. OCR skipped or fell back to the input)."""
+    if not isinstance(a, str) or not isinstance(b, str):
+        return a is b
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+# ------------------ saving ------------------
+SAVE_PROFILES = ("fast", "compact", "web")
+
+def _linearize_with_qpdf(path: str) -> bool:
+    if shutil.which("qpdf") is None:
+        print("[save] qpdf not found; 'web' output is compact but not linearized.")
+        return False
+    tmp = path + ".lin.tmp"
+    proc = subprocess.run(["qpdf", "--linearize", path, tmp], capture_output=True, text=True)
+    if proc.returncode not in (0, 3):  # 3 = success with warnings
+        print("[save] qpdf --linearize failed:\n", proc.stderr)
+        if os.path.exists(tmp): os.remove(tmp)
+        return False
+    os.replace(tmp, path)
+    return True
+
+def _write_options(doc: fitz.Document, profile: str, garbage: Optional[int] = None) -> Dict[str, Any]:
+    if profile not in SAVE_PROFILES:
+        raise ValueError(f"Unknown save profile: {profile}")
+    if profile == "fast":
+        opts: Dict[str, Any] = {}
+    else:
+        try:
+            doc.subset_fonts()
+        except Exception as e:
+            print(f"[save] subset_fonts failed, embedding full fonts: {e}")
+        opts = dict(garbage=4, deflate=True, deflate_images=True, deflate_fonts=True, use_objstms=1)
+    if garbage is not None:
+        opts["garbage"] = max(0, min(4, int(garbage)))
+    return opts
+
+def stitched_garbage(profile: str) -> Optional[int]:
+    """
+    Garbage level for a document assembled from separately painted parts (page-range
+    workers, shards): each part brings its own font copies, so identical streams must
+    be merged even under 'fast' (garbage=4; level 3 compares objects, not stream
+    contents, and keeps every copy). None keeps the profile's own level.
+    """
+    return 4 if profile == "fast" else None
+
+def pdf_bytes(doc: fitz.Document, profile: str = "fast", garbage: Optional[int] = None) -> bytes:
+    """doc serialized in memory with a save profile ('web' is treated as 'compact': qpdf needs a file)."""
+    return doc.tobytes(**_write_options(doc, "compact" if profile == "web" else profile, garbage))
+
+def save_pdf(doc: fitz.Document, path: str, profile: str = "fast",
+             garbage: Optional[int] = None) -> Tuple[float, int]:
+    """
+    Save doc with a profile and report (seconds, bytes):
+      - fast:    plain save, no compression (cheapest CPU)
+      - compact: subset embedded fonts, garbage=4 (drops unused + dedupes identical
+                 objects), deflate streams/images/fonts, object streams
+      - web:     compact, then linearized for incremental loading (needs qpdf;
+                 current MuPDF no longer linearizes itself)
+    garbage (0-4) overrides the profile's garbage-collection level; lower is faster.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    t0 = time.perf_counter()
+    doc.save(path, **_write_options(doc, profile, garbage))
+    if profile == "web":
+        _linearize_with_qpdf(path)
+    dt = time.perf_counter() - t0
+    size = os.path.getsize(path)
+    print(f"[save:{profile}] {size / 1024:.0f} KB in {dt:.2f}s -> {path}")
+    return dt, size
+
+# ------------------ packaging ------------------
+def looks_compressed(path: str, probe: int = 64 * 1024, ratio: float = 0.9) -> bool:
+    """
+    Sample the start, middle and end of the file with a fast deflate: if that
+    barely shrinks it (deflated streams/fonts/images), storing is as good as compressing.
+    """
+    size = os.path.getsize(path)
+    if size <= 0: return False
+    raw = packed = 0
+    with open(path, "rb") as f:
+        for off in sorted({0, max(0, size // 2 - probe // 2), max(0, size - probe)}):
+            f.seek(off); buf = f.read(probe)
+            raw += len(buf); packed += len(zlib.compress(buf, 1))
+    return packed >= ratio * raw
+
+def write_zip(zip_path: str, files: Iterable[Tuple[str, str]]) -> Tuple[float, int]:
+    """
+    Zip (path, arcname) pairs straight from disk into zip_path; zipfile copies each
+    member in small chunks, so no output is held in memory. Already-compressed
+    files are STORED, the rest DEFLATED. Returns (seconds, bytes).
+    """
+    t0 = time.perf_counter(); n = stored = 0
+    os.makedirs(os.path.dirname(zip_path) or ".", exist_ok=True)
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for path, arcname in files:
+            method = zipfile.ZIP_STORED if looks_compressed(path) else zipfile.ZIP_DEFLATED
+            zf.write(path, arcname=arcname, compress_type=method)
+            n += 1; stored += method == zipfile.ZIP_STORED
+    dt = time.perf_counter() - t0
+    size = os.path.getsize(zip_path)
+    print(f"[zip] {n} files ({stored} stored), {size / 1024:.0f} KB in {dt:.2f}s -> {zip_path}")
+    return dt, size
 
 def choose_langs(text: str, translate_dir: str) -> Tuple[str,str]:
     if translate_dir == "hi->en": return "hi","en"
@@ -113,24 +260,76 @@ def choose_langs(text: str, translate_dir: str) -> Tuple[str,str]:
     if sl == "en": return "en","hi"
     return "hi","en"
 
+_FONT_BYTES: Dict[str, bytes] = {}
+
+def font_bytes(fontfile: str) -> bytes:
+    """TTF contents, read once per process (see warm.warm_worker) and shared by every document."""
+    data = _FONT_BYTES.get(fontfile)
+    if data is None:
+        with open(fontfile, "rb") as f:
+            data = _FONT_BYTES[fontfile] = f.read()
+    return data
+
+class FontBook:
+    """
+    Registers each font once per output page (page.insert_font); later inserts
+    refer to it by name only instead of handing PyMuPDF the fontfile per call.
+    Use one FontBook per output document.
+    """
+    def __init__(self):
+        self._registered = set()
+
+    def use(self, page: fitz.Page, fontname: str, fontfile: Optional[str]) -> None:
+        if not fontfile: return
+        key = (page.number, fontname)
+        if key in self._registered: return
+        page.insert_font(fontname=fontname, fontbuffer=font_bytes(fontfile))
+        self._registered.add(key)
+
+_FIT_COUNTS = {"fit_reused": 0}  # insert_text_fit calls whose size came from a fits memo
+
 def insert_text_fit(page: fitz.Page, rect, text: str, fontname: str,
                     base_size: float, color: Tuple[float, ...],
                     fontfile: Optional[str] = None,
                     pad_px: Optional[float] = None,
-                    debug_outline: bool = False) -> bool:
+                    debug_outline: bool = False,
+                    fonts: Optional[FontBook] = None,
+                    fits: Optional[Dict[Any, float]] = None) -> bool:
+    """
+    Shrink text until it fits rect. fits: optional memo of the size that fitted
+    per (text, font, size, box); a repeat of the same box is then one insert
+    (counted in _FIT_COUNTS, reported through textlayer.unit_counts).
+    """
+    if fonts is not None and fontfile:
+        fonts.use(page, fontname, fontfile); fontfile = None
     r = fitz.Rect(*rect)
     if pad_px is None: pad_px = max(1.2, 0.20 * base_size)
     r = fitz.Rect(r.x0 - pad_px, r.y0 - pad_px, r.x1 + pad_px, r.y1 + pad_px)
     if debug_outline:
         sh = page.new_shape(); sh.draw_rect(r)
         sh.finish(width=0, color=None, fill=(1,0,0)); sh.commit(overlay=True)
-    for pct in (100,98,96,92,88,85,80,76,72,68,64,60,56,52,48,44,40,36,32,28,24,20,18,16,14,12,10,8,4,2):
-        fs = max(6.0, base_size*(pct/100.0))
+
+    def _box(fs: float) -> bool:
         rv = page.insert_textbox(
             r, text, fontname=fontname, fontfile=fontfile, fontsize=fs,
             lineheight=fs*1.12, color=color, align=fitz.TEXT_ALIGN_LEFT, encoding=0
         )
-        if rv is not None and rv >= 0: return True
+        return rv is not None and rv >= 0
+
+    fit_key = (text, fontname, base_size, r.width, r.height) if fits is not None else None
+    known = fits.get(fit_key) if fits is not None else None
+    if known is not None: _FIT_COUNTS["fit_reused"] += 1
+    if known and _box(known): return True
+    if known != 0.0:
+        last_fs = None
+        for pct in (100,98,96,92,88,85,80,76,72,68,64,60,56,52,48,44,40,36,32,28,24,20,18,16,14,12,10,8,4,2):
+            fs = max(6.0, base_size*(pct/100.0))
+            if fs == last_fs: break  # clamped at the 6pt floor: further tries are identical
+            last_fs = fs
+            if _box(fs):
+                if fits is not None: fits[fit_key] = fs
+                return True
+        if fits is not None: fits[fit_key] = 0.0  # nothing fits: straight to the fallback next time
     page.insert_text(r.bl, text, fontname=fontname, fontfile=fontfile, fontsize=base_size, color=color, encoding=0)
     return False
 
@@ -147,6 +346,53 @@ def resolve_font(logical_name, font_path=None):
         raise ValueError(f"Font '{logical_name}' needs a valid font file. Got: {font_path}")
     return logical_name, str(font_path)
 
+def _merged(m: fitz.Rect, r: fitz.Rect, gap: float, waste: float) -> Optional[fitz.Rect]:
+    """m | r if the two are within gap and their bounding box wastes at most `waste` of its area."""
+    if m.x0 > r.x1 + gap or r.x0 > m.x1 + gap or m.y0 > r.y1 + gap or r.y0 > m.y1 + gap:
+        return None
+    ix = max(0.0, min(m.x1, r.x1) - max(m.x0, r.x0))
+    iy = max(0.0, min(m.y1, r.y1) - max(m.y0, r.y0))
+    union = m.width * m.height + r.width * r.height - ix * iy
+    bb = m | r
+    return bb if bb.width * bb.height - union <= waste * bb.width * bb.height else None
+
+def coalesce_rects(rects: List[fitz.Rect], gap: float = 1.0, waste: float = 0.05) -> List[fitz.Rect]:
+    """
+    Merge touching/overlapping rects (within `gap` pt) whose bounding box adds at
+    most `waste` (fraction) area beyond their union, so e.g. the padded spans of a
+    line collapse into one rect without painting over unrelated content.
+
+    Sweep over y0: each rect is only compared with the kept rects whose y1 still
+    reaches it (about one line's worth), plus, when a merge grows it upwards,
+    the few that already left that band (kept sorted by y1). Among the candidates
+    the newest kept rect wins, as when the whole list was rescanned from the end.
+    """
+    active: Dict[int, fitz.Rect] = {}   # seq -> kept rect still in the band (insertion = seq order)
+    passed: Dict[int, fitz.Rect] = {}   # seq -> kept rect the sweep has left behind
+    band: List[Tuple[float, int]] = []  # heap of (y1, seq) over active
+    passed_y1: List[float] = []; passed_seq: List[int] = []  # ascending y1 (heap pop order)
+    seq = 0
+    for r in sorted((fitz.Rect(r) for r in rects), key=lambda r: (r.y0, r.x0)):
+        while band and band[0][0] + gap < r.y0:
+            y1, s = heapq.heappop(band)
+            if s in active:
+                passed[s] = active.pop(s); passed_y1.append(y1); passed_seq.append(s)
+        while True:
+            best, bb = -1, None
+            for s, m in reversed(active.items()):
+                bb = _merged(m, r, gap, waste)
+                if bb is not None: best = s; break
+            for s in passed_seq[bisect.bisect_left(passed_y1, r.y0 - gap):]:
+                if s > best and s in passed:
+                    cand = _merged(passed[s], r, gap, waste)
+                    if cand is not None: best, bb = s, cand
+            if best < 0: break
+            if best in active: del active[best]
+            else: del passed[best]
+            r = bb
+        active[seq] = r; heapq.heappush(band, (r.y1, seq)); seq += 1
+    return [r for _, r in sorted({**passed, **active}.items())]
+
 def redact_page_regions(page: fitz.Page, rects: List[fitz.Rect], fill=(1,1,1)):
     for rr in rects: page.add_redact_annot(rr, fill=fill)
     page.apply_redactions()
@@ -0,0 +1,68 @@
+from typing import Dict, Any, Iterable, List, Optional
+import os, time
+
+from .constants import FONT_EN_PATH, FONT_HI_PATH, FONT_HI_PATH_2
+
+# ------------------ pre-warmed worker processes ------------------
+# Pass warm_worker as a ProcessPoolExecutor initializer: each worker imports the
+# pipeline (fitz & co.), reads the TTFs, builds the translator and compiles the
+# glossary once, and every job it runs afterwards reuses them. Workers count the
+# jobs they ran so the parent can report the startup cost per job.
+# startup_s runs from process start: under spawn, most imports happen while the
+# parent's main module is re-imported, before the initializer. preload_s is the
+# initializer's own share.
+WARM_FONTS = (FONT_EN_PATH, FONT_HI_PATH, FONT_HI_PATH_2)
+
+_STATS: Dict[str, Any] = {"pid": None, "startup_s": 0.0, "preload_s": 0.0, "jobs": 0}
+
+def process_age_s() -> Optional[float]:
+    """Seconds since this process started, from /proc (None where that is unavailable)."""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()  # comm may contain spaces
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK"))  # field 22: starttime
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def warm_worker(fonts: Iterable[str] = WARM_FONTS, translator: bool = True) -> None:
+    t0 = time.perf_counter()
+    try:
+        from . import pipeline, jobs  # noqa: F401  every stage module and its heavy imports
+        from .utils import font_bytes
+        from .constants import translator as build_translator
+        from .glossary import active_glossary
+        for path in fonts:
+            if path and os.path.exists(path): font_bytes(path)
+        if translator: build_translator()
+        active_glossary()
+    except Exception as e:  # an initializer error would break the whole pool; jobs load lazily instead
+        print(f"[warm] preload failed, continuing cold: {type(e).__name__}: {e}")
+    preload = time.perf_counter() - t0
+    age = process_age_s()
+    _STATS.update(pid=os.getpid(), startup_s=round(preload if age is None else max(age, preload), 3),
+                  preload_s=round(preload, 3), jobs=0)
+    print(f"[warm] worker {os.getpid()} ready {_STATS['startup_s']:.2f}s after start "
+          f"(preload {_STATS['preload_s']:.2f}s)")
+
+def warm_ping() -> Dict[str, Any]:
+    """No-op task: submitting one per worker starts (and warms) the pool ahead of the first job."""
+    return dict(_STATS, pid=os.getpid())
+
+def note_job() -> Dict[str, Any]:
+    """Call once per finished job in a worker; returns this worker's stats for the parent."""
+    _STATS["jobs"] += 1
+    return dict(_STATS, pid=os.getpid())
+
+def summarize_workers(stats: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine per-worker stats (latest per pid): total startup (from process start), jobs, startup per job."""
+    latest: Dict[int, Dict[str, Any]] = {}
+    for st in stats:
+        prev = latest.get(st["pid"])
+        if prev is None or st["jobs"] >= prev["jobs"]: latest[st["pid"]] = st
+    startup = sum(st["startup_s"] for st in latest.values())
+    preload = sum(st.get("preload_s", 0.0) for st in latest.values())
+    jobs = sum(st["jobs"] for st in latest.values())
+    return {"workers": len(latest), "startup_s": round(startup, 3), "preload_s": round(preload, 3), "jobs": jobs,
+            "amortized_startup_s": round(startup / jobs, 3) if jobs else None}
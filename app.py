@@ -1,22 +1,20 @@
 # app.py
-import os, io, time, tempfile, zipfile, json, re
-from pathlib import Path
-
 import streamlit as st
-import fitz
 
 from PDF_Translate.constants import (
-    DEFAULT_LANG, DEFAULT_DPI, DEFAULT_OPTIMIZE, DEFAULT_TRANSLATE_DIR,
-    DEFAULT_ERASE, FONT_EN_LOGICAL, FONT_EN_PATH, FONT_HI_LOGICAL,
-    FONT_HI_PATH, FONT_HI_PATH_2, FONT_HI_LOGICAL_2
+    DEFAULT_LANG, DEFAULT_DPI, DEFAULT_OPTIMIZE, FONT_EN_PATH, FONT_HI_PATH_2
 )
-from PDF_Translate.textlayer import extract_original_page_objects
-from PDF_Translate.ocr import ocr_fix_pdf
-from PDF_Translate.utils import build_base, resolve_font
-from PDF_Translate.overlay import build_overlay_items_from_doc
-from PDF_Translate.pipeline import run_mode
+from PDF_Translate.jobs import JobManager
+
+from PDF_Translate.highlight_boxes import _hex_to_rgb01
 
-from PDF_Translate.highlight_boxes import _hex_to_rgb01, add_boxes_to_pdf, build_annotation_items_from_pdf
+# ----------------------------
+# Job pool (one per server process, shared by all sessions).
+# Concurrency: PDF_TRANSLATE_JOB_WORKERS (default 2).
+# ----------------------------
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    return JobManager()
 
 # ----------------------------
 # Streamlit layout
@@ -32,6 +30,10 @@ with st.sidebar:
     st.header("Settings")
     mode = st.selectbox("Mode", ["all","overlay","hybrid","block","line","span"], index=0)
     translate_dir = st.selectbox("Translate Direction", ["en->hi","hi->en","auto"], index=0)
+    block_context = st.checkbox(
+        "Translate span/line modes block by block", value=False,
+        help="One request per block instead of per line/span; better context, fewer requests."
+    )
     erase_mode = st.selectbox("Erase original text", ["redact","mask","none"], index=0)
     lang = st.text_input("OCR language(s)", DEFAULT_LANG)
     dpi = st.text_input("OCR image DPI", DEFAULT_DPI)
@@ -72,172 +74,137 @@ with st.sidebar:
     annot_fill_opacity = st.slider("Fill opacity", 0.0, 1.0, 0.15, step=0.05)
     annot_color_hex = st.color_picker("Color", "#FF0000")
     annot_fill = st.checkbox("Fill rectangle", value=True)
+    annot_json = st.checkbox("Include annotation items JSON in the ZIP", value=False)
+    annot_garbage = st.select_slider(
+        "Annotated PDF cleanup (garbage level)", options=[0, 1, 2, 3, 4], value=4,
+        help="4 = smallest file but slowest save; 0-1 save much faster."
+    )
 
 # ----------------------------
 # Main UI
 # ----------------------------
 st.write("Upload a PDF for Translation.")
 pdf_file = st.file_uploader("PDF", type=["pdf"])
+jobs = get_job_manager()
+st.session_state.setdefault("job_ids", [])
 
 if st.button("Run translation", disabled=pdf_file is None, type="primary"):
-    with st.spinner("Processing..."):
-        with tempfile.TemporaryDirectory() as workdir:
-            workdir = Path(workdir)
-
-            # Save uploaded PDF to temp
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=workdir) as tf:
-                tf.write(pdf_file.read())
-                input_pdf_path = tf.name
-
-            # Extract original layout index (for overlay / alignment)
-            orig_index = extract_original_page_objects(input_pdf_path)
-
-            # Optionally OCR-fix PDF
-            src_fixed = input_pdf_path if skip_ocr else ocr_fix_pdf(
-                input_pdf_path, lang=lang, dpi=dpi, optimize=optimize
-            )
-
-            # Build base in/out paths
-            src, out = build_base(src_fixed)
-
-            # Resolve fonts
-            en_name, en_file = resolve_font(FONT_EN_LOGICAL, en_font_path)
-            if hi_font_path:
-                hi_name, hi_file = resolve_font(FONT_HI_LOGICAL_2, hi_font_path)
-            else:
-                hi_name, hi_file = ("helv", None)
-
-            # Overlay items (optional)
-            overlay_items = None
-            if mode in ("overlay","all"):
-                if auto_overlay:
-                    overlay_items = build_overlay_items_from_doc(src, translate_dir)
-                elif mode == "overlay":
-                    st.error("Overlay mode requires JSON or enable Auto overlay.")
-                    st.stop()
-
-            # Output naming
-            timestamp = time.strftime("%Y%m%d-%H%M%S")
-            out_name = f"result_{timestamp}.pdf" if mode!="all" else f"result_{timestamp}.all.pdf"
-            output_pdf_path = str(workdir / out_name)
-
-            # Run the pipeline
-            run_mode(
-                mode=mode,
-                src=src, out=out,
-                orig_index=orig_index,
-                translate_dir=translate_dir,
-                erase_mode=erase_mode,
-                redact_color=(1,1,1),
-                font_en_name=en_name, font_en_file=en_file,
-                font_hi_name=hi_name, font_hi_file=hi_file,
-                output_pdf=output_pdf_path,
-                overlay_items=overlay_items,
-                overlay_render=overlay_render,
-                overlay_align={0:0,1:1,2:2,3:3}[overlay_align],
-                overlay_line_spacing=overlay_line_spacing,
-                overlay_margin_px=overlay_margin_px,
-                overlay_target_dpi=int(overlay_target_dpi),
-                overlay_scale_x=float(overlay_scale_x),
-                overlay_scale_y=float(overlay_scale_y),
-                overlay_off_x=float(overlay_off_x),
-                overlay_off_y=float(overlay_off_y),
-            )
-
-            # Collect produced PDFs
-            if mode == "all":
-                pdfs = sorted(workdir.glob(f"result_{timestamp}.all.*.pdf"))
-                zip_display_name = f"result_{timestamp}.all_all_methods.zip"
+    if mode == "overlay" and not auto_overlay:
+        st.error("Overlay mode requires JSON or enable Auto overlay.")
+        st.stop()
+
+    # ----------------------------
+    # Auto-generate annotation settings (no upload needed)
+    # ----------------------------
+    annotate = None
+    if do_annotate:
+        # Choose generation mode
+        if annot_method == "Devanagari words":
+            gen_mode = "devanagari_words"
+            pattern = r"[\u0900-\u097F]+"
+        elif annot_method == "English words":
+            gen_mode = "english_words"
+            pattern = r"[A-Za-z]+"
+        elif annot_method == "All text blocks":
+            gen_mode = "all_text_blocks"
+            pattern = ""
+        else:
+            gen_mode = "regex"
+            pattern = custom_regex or r".+"
+        annotate = dict(
+            mode=gen_mode,
+            regex_pattern=pattern,
+            min_w=float(min_w),
+            min_h=float(min_h),
+            merge_lines=bool(merge_lines),
+            margin=float(expand_margin),
+            color=_hex_to_rgb01(annot_color_hex),
+            stroke_width=float(annot_stroke_width),
+            fill_opacity=float(annot_fill_opacity),
+            use_annot=(annot_use_annot == "annotation-layer"),
+            fill=bool(annot_fill),
+            json=bool(annot_json),
+            garbage=int(annot_garbage),
+        )
+
+    opts = dict(
+        mode=mode, translate_dir=translate_dir, erase_mode=erase_mode,
+        lang=lang, dpi=dpi, optimize=optimize, skip_ocr=skip_ocr,
+        auto_overlay=auto_overlay,
+        overlay_render=overlay_render,
+        overlay_align={0:0,1:1,2:2,3:3}[overlay_align],
+        overlay_line_spacing=float(overlay_line_spacing),
+        overlay_margin_px=float(overlay_margin_px),
+        overlay_target_dpi=int(overlay_target_dpi),
+        overlay_scale_x=float(overlay_scale_x),
+        overlay_scale_y=float(overlay_scale_y),
+        overlay_off_x=float(overlay_off_x),
+        overlay_off_y=float(overlay_off_y),
+        font_en_path=en_font_path, font_hi_path=hi_font_path,
+        block_context=bool(block_context),
+        annotate=annotate,
+    )
+    job_id = jobs.submit(pdf_file.getvalue(), opts, filename=pdf_file.name)
+    st.session_state["job_ids"].append(job_id)
+
+# ----------------------------
+# Jobs of this session. Only the fragment with the in-flight jobs is polled;
+# the rest of the page (and the download buttons, which read the ZIP) reruns
+# once when a job finishes, not every second.
+# ----------------------------
+def job_header(job_id: str, status: dict) -> None:
+    st.markdown(f"**{status.get('filename', 'PDF')}** · `{job_id}` · {status.get('state')}")
+
+@st.fragment(run_every=1.0)
+def active_jobs(job_ids: list) -> None:
+    for job_id in job_ids:
+        status = jobs.status(job_id)
+        state = status.get("state", "unknown")
+        if state not in ("queued", "running"):
+            st.rerun()  # whole page: move it to the finished list
+        with st.container(border=True):
+            job_header(job_id, status)
+            label = (f"Waiting in queue (position {status.get('queue_position', 1)})"
+                     if state == "queued" else f"Processing: {status.get('stage', '')}")
+            st.progress(float(status.get("progress", 0.0)), text=label)
+            if st.button("Cancel", key=f"cancel-{job_id}"):
+                jobs.cancel(job_id)
+                st.rerun()
+
+statuses = [(job_id, jobs.status(job_id)) for job_id in reversed(st.session_state["job_ids"])]
+active = [job_id for job_id, status in statuses if status.get("state") in ("queued", "running")]
+if active:
+    active_jobs(active)
+
+for job_id, status in statuses:
+    state = status.get("state", "unknown")
+    if state in ("unknown", "queued", "running"):
+        continue
+    with st.container(border=True):
+        job_header(job_id, status)
+        if state == "done":
+            result = status["result"]
+            if status.get("warning"):
+                st.error(status["warning"])
+            timings = ", ".join(f"{k} {v:.1f}s" for k, v in result.get("timings", {}).items())
+            if status.get("cached") == "result":
+                st.caption("Served from cache (same PDF and settings).")
             else:
-                pdfs = [Path(output_pdf_path)] if Path(output_pdf_path).exists() else sorted(workdir.glob(f"result_{timestamp}*.pdf"))
-                zip_display_name = f"result_{timestamp}.{mode}.zip"
-
-            if not pdfs:
-                st.error("No PDFs produced by the pipeline.")
-                all_files = [str(p.relative_to(workdir)) for p in workdir.glob("**/*")]
-                st.write("Files in temp workspace:", all_files)
-                st.stop()
-
-            # ----------------------------
-            # Auto-generate annotation JSON (no upload needed)
-            # ----------------------------
-            annotated_pdfs = []
-            generated_json_bytes = None
-            if do_annotate:
-                try:
-                    # Choose generation mode
-                    if annot_method == "Devanagari words":
-                        gen_mode = "devanagari_words"
-                        pattern = r"[\u0900-\u097F]+"
-                    elif annot_method == "English words":
-                        gen_mode = "english_words"
-                        pattern = r"[A-Za-z]+"
-                    elif annot_method == "All text blocks":
-                        gen_mode = "all_text_blocks"
-                        pattern = ""
-                    else:
-                        gen_mode = "regex"
-                        pattern = custom_regex or r".+"
-
-                    # Generate items from the *produced* PDF you want to annotate.
-                    # Here we annotate each produced PDF independently.
-                    color = _hex_to_rgb01(annot_color_hex)
-                    for p in pdfs:
-                        p = Path(p)
-                        items = build_annotation_items_from_pdf(
-                            pdf_path=str(p),
-                            mode=gen_mode,
-                            regex_pattern=pattern,
-                            min_w=float(min_w),
-                            min_h=float(min_h),
-                            merge_lines=bool(merge_lines),
-                            margin=float(expand_margin),
-                        )
-                        # Save the JSON (optional, for debugging/user download)
-                        gen_json_path = p.with_name(p.stem + ".annotation_items.json")
-                        with open(gen_json_path, "w", encoding="utf-8") as jf:
-                            json.dump(items, jf, ensure_ascii=False, indent=2)
-
-                        out_annot = p.with_name(p.stem + ".annot.pdf")
-                        add_boxes_to_pdf(
-                            input_pdf=str(p),
-                            items=items,
-                            output_pdf=str(out_annot),
-                            page_is_one_based=False,
-                            color=color,
-                            stroke_width=float(annot_stroke_width),
-                            fill_opacity=float(annot_fill_opacity),
-                            use_annot=(annot_use_annot == "annotation-layer"),
-                            fill=bool(annot_fill),
-                        )
-                        annotated_pdfs.append(out_annot)
-
-                    if annotated_pdfs:
-                        zip_display_name = zip_display_name.replace(".zip", ".with_annotations.zip")
-                except Exception as e:
-                    st.error(f"Failed to auto-generate annotations: {e}")
-
-            # ----------------------------
-            # Package results (original + annotated, if any)
-            # ----------------------------
-            zip_buf = io.BytesIO()
-            with zipfile.ZipFile(zip_buf, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-                for p in pdfs:
-                    zf.write(p, arcname=Path(p).name)
-                for ap in annotated_pdfs:
-                    zf.write(ap, arcname=Path(ap).name)
-                # also include the JSONs we generated (one per PDF)
-                if do_annotate:
-                    for p in pdfs:
-                        gen_json = Path(p).with_name(Path(p).stem + ".annotation_items.json")
-                        if gen_json.exists():
-                            zf.write(gen_json, arcname=gen_json.name)
-            zip_buf.seek(0)
-
-    st.success("Done!")
-    st.download_button(
-        "⬇️ Download results (ZIP)",
-        data=zip_buf.getvalue(),
-        file_name=zip_display_name,
-        mime="application/zip"
-    )
\ No newline at end of file
+                cached = " · translation reused from cache" if status.get("cached") else ""
+                size = f" · ZIP {result['zip_bytes'] / 1024 / 1024:.1f} MB" if result.get("zip_bytes") else ""
+                st.caption(f"Timings: {timings}{size}{cached}")
+                if result.get("annotate_timings"):
+                    per_output = ", ".join(f"{k} {v:.1f}s" for k, v in result["annotate_timings"].items())
+                    st.caption(f"Annotation (parallel): {per_output}")
+            with open(result["zip"], "rb") as zf:
+                st.download_button(
+                    "⬇️ Download results (ZIP)",
+                    data=zf,
+                    file_name=result["zip_name"],
+                    mime="application/zip",
+                    key=f"dl-{job_id}",
+                )
+        elif state == "failed":
+            st.error(status.get("error", "Job failed."))
+        else:
+            st.info("Cancelled.")